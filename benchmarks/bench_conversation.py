@@ -0,0 +1,193 @@
+##########################################################
+# benchmarks/bench_conversation.py
+##########################################################
+"""
+End-to-end benchmark of run_famous_people_contest against the local
+stub OpenAI server (no network needed).
+
+For every configuration (speaker scheduler x token streaming) it runs a
+few seeded conversations and reports:
+  - total wall time and time to the first agent message
+  - number of model calls, split by selector vs. agent
+  - prompt / completion tokens per turn
+  - prompt tokens per model call, which compares configurations even
+    when their conversations differ in length
+  - how the prompt size grows across turns
+
+Usage:
+    python benchmarks/bench_conversation.py --runs 3 --schedulers local,llm --stream off,on
+    python benchmarks/bench_conversation.py --schedulers local --stream off --context 0,4 --rounds 9
+    python benchmarks/bench_conversation.py --schedulers local,llm --stream on --pipeline off,on
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time_machine as tm  # noqa: E402
+from stub_openai import StubOpenAIServer  # noqa: E402
+
+
+@dataclass
+class RunStats:
+    config: str
+    seed: int
+    wall_seconds: float = 0.0
+    first_message_seconds: float = 0.0
+    messages: int = 0
+    selector_calls: int = 0
+    agent_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # One entry per model call, in order: [kind, role, prompt, completion]
+    turns: list = field(default_factory=list)
+
+
+def stub_model_client(stub: StubOpenAIServer, model: str = tm.MODEL_NAME, **kwargs):
+    """An OpenAI client pointed at the stub server, as the app creates it."""
+    return tm.UsageOpenAIChatCompletionClient(
+        model=model,
+        api_key="stub",
+        base_url=stub.url,
+        temperature=tm.MODEL_TEMPERATURE,
+        **kwargs,
+    )
+
+
+async def run_conversation(config: str, seed: int, stub: StubOpenAIServer, model_client, **contest_kwargs) -> RunStats:
+    """Runs one seeded conversation and collects its stats from the stub's log."""
+    random.seed(seed)
+    stub.take_requests()
+    stats = RunStats(config=config, seed=seed)
+    # Messages said without a model call don't count as the first message
+    local_sources = {"user", "God"} if contest_kwargs.get("scripted_turns", tm.SCRIPTED_TURNS) else {"user"}
+
+    started = time.monotonic()
+    async for step in tm.run_famous_people_contest(model_client, **contest_kwargs):
+        source = getattr(step, "source", "")
+        content = getattr(step, "content", None)
+        if not isinstance(content, str):
+            continue
+        if not stats.first_message_seconds and source not in local_sources and content.strip():
+            stats.first_message_seconds = time.monotonic() - started
+        if not isinstance(step, tm.TokenChunk):
+            stats.messages += 1
+    stats.wall_seconds = time.monotonic() - started
+
+    for request in stub.take_requests():
+        if request["kind"] == "selector":
+            stats.selector_calls += 1
+        else:
+            stats.agent_calls += 1
+        stats.prompt_tokens += request["prompt_tokens"]
+        stats.completion_tokens += request["completion_tokens"]
+        stats.turns.append([request["kind"], request["role"], request["prompt_tokens"], request["completion_tokens"]])
+    return stats
+
+
+def prompt_growth(stats: RunStats) -> str:
+    """Prompt tokens of the agent calls, first to last."""
+    sizes = [turn[2] for turn in stats.turns if turn[0] == "agent"]
+    if len(sizes) < 2:
+        return "-"
+    per_turn = (sizes[-1] - sizes[0]) / (len(sizes) - 1)
+    return f"{sizes[0]} -> {sizes[-1]} (+{per_turn:.0f}/turn)"
+
+
+def print_summary(results: list):
+    header = (f"{'config':<50}{'wall s':>8}{'first s':>9}{'msgs':>6}{'sel':>5}{'agent':>6}{'prompt tok':>11}"
+              f"{'compl tok':>10}{'prompt/call':>12}  prompt growth")
+    print(header)
+    print("-" * len(header))
+    by_config = {}
+    for stats in results:
+        by_config.setdefault(stats.config, []).append(stats)
+    for config, runs in by_config.items():
+        mean = lambda attr: statistics.mean(getattr(r, attr) for r in runs)  # noqa: E731
+        per_call = statistics.mean(r.prompt_tokens / max(1, r.selector_calls + r.agent_calls) for r in runs)
+        print(
+            f"{config:<50}{mean('wall_seconds'):>8.2f}{mean('first_message_seconds'):>9.2f}"
+            f"{mean('messages'):>6.1f}{mean('selector_calls'):>5.1f}{mean('agent_calls'):>6.1f}"
+            f"{mean('prompt_tokens'):>11.0f}{mean('completion_tokens'):>10.0f}{per_call:>12.0f}  {prompt_growth(runs[0])}"
+        )
+
+
+def print_turns(stats: RunStats):
+    print(f"\n{stats.config} (seed {stats.seed}): tokens per model call")
+    for i, (kind, role, prompt, completion) in enumerate(stats.turns, 1):
+        print(f"  {i:>3} {kind:<9}{role:<24}{prompt:>7} prompt {completion:>5} completion")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="conversations per configuration")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--schedulers", default="local,llm", help="comma separated: local, llm")
+    parser.add_argument("--stream", default="off,on", help="comma separated: off, on")
+    parser.add_argument("--context", default="0", help="comma separated context windows, 0: full history")
+    parser.add_argument("--pipeline", default="on", help="comma separated: off, on")
+    parser.add_argument("--no-scripted", action="store_true", help="let the model say God's line")
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--rounds", type=int, default=5, help="rounds in the stub's own selector flow")
+    parser.add_argument("--turns", action="store_true", help="print the tokens of every model call")
+    parser.add_argument("--json", help="write all run stats to this file")
+    return parser
+
+
+async def bench(args) -> list:
+    results = []
+    with StubOpenAIServer(
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        rounds=args.rounds,
+    ) as stub:
+        model_client = stub_model_client(stub)
+        for scheduler in args.schedulers.split(","):
+            for stream in args.stream.split(","):
+                for context in args.context.split(","):
+                    for pipeline in args.pipeline.split(","):
+                        config = f"scheduler={scheduler} stream={stream}"
+                        if context != "0":
+                            config += f" context={context}"
+                        if pipeline != "on":
+                            config += " pipeline=off"
+                        for run in range(args.runs):
+                            results.append(await run_conversation(
+                                config,
+                                args.seed + run,
+                                stub,
+                                model_client,
+                                stream_tokens=stream == "on",
+                                scheduler=scheduler,
+                                scripted_turns=not args.no_scripted,
+                                context_window=int(context),
+                                pipeline=pipeline == "on",
+                            ))
+    return results
+
+
+def main():
+    args = build_parser().parse_args()
+    results = asyncio.run(bench(args))
+    print_summary(results)
+    if args.turns:
+        seen = set()
+        for stats in results:
+            if stats.config not in seen:
+                seen.add(stats.config)
+                print_turns(stats)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+##########################################################
+# benchmarks/bench_governor.py
+##########################################################
+"""
+Load test of the request governor against the local stub OpenAI server,
+which enforces a requests-per-minute limit and fails a share of the
+requests on purpose (429 or 5xx).
+
+It starts a burst of concurrent conversations twice:
+  - "plain": the OpenAI client as is (its own 2 retries, no shaping)
+  - "governed": the same client run through tm.RequestGovernor
+and reports, per configuration:
+  - conversations finished / cut short / failed, and the errors they
+    failed with (a show that breaks off because an agent's model call
+    failed raises tm.ConversationFailedError; "cut short" counts shows
+    that ended without "Thank you everyone!" anyway, which should be 0)
+  - requests answered vs. refused by the stub (rate limit / injected)
+  - the governor's retries, throttling and breaker state
+  - wall time and the median conversation time
+
+Usage:
+    python benchmarks/bench_governor.py --conversations 12 --rpm 120 --error-rate 0.1
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time_machine as tm  # noqa: E402
+from bench_conversation import stub_model_client  # noqa: E402
+from stub_openai import StubOpenAIServer  # noqa: E402
+
+
+async def run_one(model_client, index: int) -> dict:
+    started = time.monotonic()
+    closed = False
+    try:
+        async for step in tm.run_famous_people_contest(model_client, stream_tokens=True):
+            if not isinstance(step, tm.TokenChunk) and "Thank you everyone!" in str(getattr(step, "content", "")):
+                closed = True
+        error = None
+    except Exception as e:
+        error = type(e).__name__
+    return {"index": index, "seconds": time.monotonic() - started, "error": error, "closed": closed}
+
+
+async def run_config(name: str, stub: StubOpenAIServer, model_client, conversations: int, governor=None) -> dict:
+    stub.take_requests()
+    stub.take_rejected()
+    started = time.monotonic()
+    runs = await asyncio.gather(*[run_one(model_client, i) for i in range(conversations)])
+    wall = time.monotonic() - started
+    finished = [r for r in runs if r["error"] is None and r["closed"]]
+    report = {
+        "config": name,
+        "finished": len(finished),
+        "cut_short": sum(r["error"] is None and not r["closed"] for r in runs),
+        "failed": sum(r["error"] is not None for r in runs),
+        "errors": dict(collections.Counter(r["error"] for r in runs if r["error"])),
+        "answered": len(stub.take_requests()),
+        "refused": stub.take_rejected(),
+        "wall_seconds": round(wall, 2),
+        "median_conversation_seconds": round(statistics.median(r["seconds"] for r in finished), 2) if finished else None,
+    }
+    if governor is not None:
+        report["governor"] = governor.metrics()
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n{report['config']}")
+    print(f"  conversations: {report['finished']} finished, {report['cut_short']} cut short, "
+          f"{report['failed']} failed {report['errors'] or ''}")
+    refused = report["refused"]
+    print(f"  requests: {report['answered']} answered, {refused['rate_limit']} refused by the rate limit, "
+          f"{refused['injected']} failed on purpose")
+    print(f"  wall {report['wall_seconds']} s, median conversation {report['median_conversation_seconds']} s")
+    if "governor" in report:
+        g = report["governor"]
+        print(f"  governor: {g['calls']} calls, {g['retries']} retries, {g['throttled']} throttled, "
+              f"{g['failed']} gave up, {g['rejected']} rejected by the breaker ({g['state']}), "
+              f"concurrency {g['concurrency']}, {g['waited_seconds']} s waiting for limits")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=12, help="conversations started at once")
+    parser.add_argument("--rpm", type=int, default=120, help="requests per minute the stub allows")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute the stub allows (0: no limit)")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="share of requests the stub fails")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--rounds", type=int, default=3, help="rounds in the stub's own selector flow")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the reports to this file")
+    return parser
+
+
+async def bench(args) -> list:
+    reports = []
+    with StubOpenAIServer(
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        rounds=args.rounds,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+    ) as stub:
+        reports.append(await run_config("plain", stub, stub_model_client(stub), args.conversations))
+
+        # The stub's window must be empty again for a fair comparison
+        await asyncio.sleep(60)
+        governor = tm.RequestGovernor(
+            # Deliberately wrong starting points: the headers correct them.
+            # The stub only sends the token headers with a token limit.
+            requests_per_minute=tm.MODEL_REQUESTS_PER_MINUTE,
+            tokens_per_minute=tm.MODEL_TOKENS_PER_MINUTE if args.tpm else 0,
+            max_concurrency=tm.MODEL_MAX_CONCURRENCY,
+            max_retries=tm.MODEL_MAX_RETRIES,
+            breaker_failures=tm.BREAKER_FAILURES,
+            breaker_cooldown=tm.BREAKER_COOLDOWN,
+        )
+        client = tm.GovernedModelClient(stub_model_client(stub, **tm.governed_client_args(governor)), governor)
+        reports.append(await run_config("governed", stub, client, args.conversations, governor))
+    return reports
+
+
+def main():
+    args = build_parser().parse_args()
+    reports = asyncio.run(bench(args))
+    for report in reports:
+        print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+##########################################################
+# benchmarks/bench_load.py
+##########################################################
+"""
+Scaling benchmark of one app process: how many sessions pressing "Run"
+at once it serves before latency collapses, and where the time goes.
+
+Every simulated session is a thread, like the script thread Streamlit
+gives each browser session, and takes the same path as main(): the
+process-wide ConversationService and runtime loop, and one shared model
+client (governed unless --no-governor) pointed at the local stub OpenAI
+server. Nothing is drawn; a session just consumes the message stream.
+
+For every concurrency level it reports:
+  - time in line (until the service admits the conversation)
+  - time to the first model-generated message or token (God's line does
+    not count when it is scripted) and to the end of the conversation, as
+    p50 / p95 / p99 over all conversations of the level
+  - throughput in conversations per minute
+  - process CPU (share of one core) and peak RSS
+
+The stub runs in this process by default, so its CPU is included; with
+--stub-url the sessions use a separately started stub instead:
+    python benchmarks/stub_openai.py --port 8808
+
+Usage:
+    python benchmarks/bench_load.py --sessions 1,4,16,32 --runs 2 --max-conversations 8
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time_machine as tm  # noqa: E402
+from stub_openai import StubOpenAIServer  # noqa: E402
+
+
+def rss_mb() -> float:
+    """The process's resident memory, in MiB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # Peak, not current, but the best the platform offers (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class PeakRss:
+    """Samples the RSS on a background thread while in the 'with' block."""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values: list, p: int) -> float:
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+# Sources of messages that are said without a model call
+LOCAL_SOURCES = {"user", "God"} if tm.SCRIPTED_TURNS else {"user"}
+
+
+def run_session(service: tm.ConversationService, model_client, index: int, runs: int, results: list):
+    """One session pressing "Run" 'runs' times, one conversation after the other."""
+    for run in range(runs):
+        # Draw the setup here, like the session thread does
+        setup = tm.draw_contest_setup(random.Random(index * 1000 + run))
+        record = {"session": index, "error": None}
+        started = time.monotonic()
+
+        def on_position(position: int):
+            if position == 0:
+                record.setdefault("queue_seconds", time.monotonic() - started)
+
+        def contest():
+            return tm.run_famous_people_contest(model_client, setup=setup, stream_tokens=tm.STREAM_TOKENS)
+
+        try:
+            for m in service.stream(f"load-{index}", contest, on_position):
+                if "first_message_seconds" not in record and getattr(m, "source", "user") not in LOCAL_SOURCES:
+                    record["first_message_seconds"] = time.monotonic() - started
+        except Exception as e:
+            record["error"] = type(e).__name__
+        record["total_seconds"] = time.monotonic() - started
+        results.append(record)
+
+
+def run_level(service: tm.ConversationService, model_client, sessions: int, args) -> dict:
+    results = []
+    threads = [
+        threading.Thread(target=run_session, args=(service, model_client, i, args.runs, results))
+        for i in range(sessions)
+    ]
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    with PeakRss() as rss:
+        for thread in threads:
+            thread.start()
+            if args.arrival:
+                time.sleep(random.expovariate(1 / args.arrival))
+        for thread in threads:
+            thread.join()
+    wall = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+
+    ok = [r for r in results if r["error"] is None]
+    column = lambda key: [r[key] for r in ok if key in r]  # noqa: E731
+    report = {
+        "sessions": sessions,
+        "conversations": len(results),
+        "failed": len(results) - len(ok),
+        "wall_seconds": wall,
+        "throughput_per_minute": 60 * len(ok) / wall,
+        "cpu_share": cpu / wall,
+        "peak_rss_mb": rss.peak,
+    }
+    for key in ("queue_seconds", "first_message_seconds", "total_seconds"):
+        values = column(key)
+        for p in (50, 95, 99):
+            report[f"{key}_p{p}"] = percentile(values, p)
+    return report
+
+
+def print_reports(reports: list):
+    header = (f"{'sessions':>8}{'convs':>7}{'fail':>5}{'queue p50/p95':>16}{'first msg p50/p95/p99':>24}"
+              f"{'total p50/p95/p99':>22}{'conv/min':>10}{'cpu':>7}{'rss MiB':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        queue = f"{r['queue_seconds_p50']:.1f}/{r['queue_seconds_p95']:.1f}"
+        first = "/".join(f"{r[f'first_message_seconds_p{p}']:.1f}" for p in (50, 95, 99))
+        total = "/".join(f"{r[f'total_seconds_p{p}']:.1f}" for p in (50, 95, 99))
+        print(f"{r['sessions']:>8}{r['conversations']:>7}{r['failed']:>5}{queue:>16}{first:>24}{total:>22}"
+              f"{r['throughput_per_minute']:>10.1f}{r['cpu_share']:>7.0%}{r['peak_rss_mb']:>9.0f}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,4,16,32", help="comma separated concurrency levels")
+    parser.add_argument("--runs", type=int, default=2, help="conversations per session, back to back")
+    parser.add_argument("--arrival", type=float, default=0.0, help="mean seconds between session starts (0: all at once)")
+    parser.add_argument("--max-conversations", type=int, default=tm.MAX_CONCURRENT_CONVERSATIONS,
+                        help="the service's concurrency limit (TIME_MACHINE_MAX_CONVERSATIONS)")
+    parser.add_argument("--no-governor", action="store_true", help="do not run the calls through the governor")
+    parser.add_argument("--stub-url", help="use a stub server that is already running, e.g. http://127.0.0.1:8808/v1")
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--rounds", type=int, default=5, help="rounds in the stub's own selector flow")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the reports to this file")
+    return parser
+
+
+def bench(args, url: str) -> list:
+    # Created once, like get_service() and get_model_client() in the app
+    service = tm.ConversationService(tm.ConversationRuntime(), args.max_conversations)
+    model_client = tm.create_model_client(
+        cache_mode="off",
+        governor=None if args.no_governor else tm.create_governor(),
+        api_key="stub",
+        base_url=url,
+    )
+    reports = []
+    for sessions in (int(n) for n in args.sessions.split(",")):
+        random.seed(args.seed)
+        reports.append(run_level(service, model_client, sessions, args))
+        print(f"  {sessions} sessions done", file=sys.stderr)
+    return reports
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.stub_url:
+        reports = bench(args, args.stub_url)
+    else:
+        with StubOpenAIServer(
+            first_token_latency=args.first_token_latency,
+            token_latency=args.token_latency,
+            rounds=args.rounds,
+        ) as stub:
+            reports = bench(args, stub.url)
+    print_reports(reports)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
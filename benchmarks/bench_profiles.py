@@ -0,0 +1,139 @@
+##########################################################
+# benchmarks/bench_profiles.py
+##########################################################
+"""
+Compares generation profile sets against the local stub OpenAI server,
+which serves the large and the small model at different latencies and
+honours max_tokens and stop like the real API.
+
+Profile sets:
+  - "single": every role on tm.MODEL_NAME, uncapped (profiles off)
+  - "routed": tm.ROUTED_PROFILES (selector, God and the Host's
+    bookkeeping turns on tm.SMALL_MODEL_NAME, completions capped)
+  - any JSON file of overrides, as for TIME_MACHINE_PROFILES
+
+For each set it reports the wall time per conversation and, per role,
+the model used, the number of calls, mean latency, tokens and cost.
+
+Usage:
+    python benchmarks/bench_profiles.py --runs 3 --profiles single,routed --scheduler llm
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time_machine as tm  # noqa: E402
+from bench_conversation import stub_model_client  # noqa: E402
+from stub_openai import StubOpenAIServer  # noqa: E402
+
+# USD per million (prompt, completion) tokens; adjust to current pricing
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def role_of(request: dict) -> str:
+    """The profile role of a logged stub request."""
+    if request["kind"] == "selector":
+        return "selector"
+    if request["role"] in ("God", "Host"):
+        return request["role"]
+    return "Arguer"
+
+
+def cost(model: str, prompt: int, completion: int) -> float:
+    prompt_price, completion_price = PRICES.get(model, (0.0, 0.0))
+    return (prompt * prompt_price + completion * completion_price) / 1e6
+
+
+async def run_profile_set(name: str, profiles, stub: StubOpenAIServer, model_client, args) -> dict:
+    walls = []
+    requests = []
+    for run in range(args.runs):
+        random.seed(args.seed + run)
+        stub.take_requests()
+        started = time.monotonic()
+        async for _ in tm.run_famous_people_contest(
+            model_client,
+            stream_tokens=True,
+            scheduler=args.scheduler,
+            scripted_turns=not args.no_scripted,
+            profiles=profiles,
+        ):
+            pass
+        walls.append(time.monotonic() - started)
+        requests += stub.take_requests()
+
+    roles = collections.defaultdict(list)
+    for request in requests:
+        roles[role_of(request)].append(request)
+    per_role = {}
+    for role, calls in sorted(roles.items()):
+        prompt = sum(c["prompt_tokens"] for c in calls)
+        completion = sum(c["completion_tokens"] for c in calls)
+        per_role[role] = {
+            "models": sorted({c["model"] for c in calls}),
+            "calls": len(calls) / args.runs,
+            "latency": statistics.mean(c["ended"] - c["started"] for c in calls),
+            "prompt_tokens": prompt / args.runs,
+            "completion_tokens": completion / args.runs,
+            "cost": sum(cost(c["model"], c["prompt_tokens"], c["completion_tokens"]) for c in calls) / args.runs,
+        }
+    return {"profiles": name, "wall_seconds": statistics.mean(walls), "roles": per_role}
+
+
+def print_report(report: dict):
+    total = sum(r["cost"] for r in report["roles"].values())
+    print(f"\nprofiles={report['profiles']}: {report['wall_seconds']:.2f} s and ${total:.5f} per conversation")
+    print(f"  {'role':<18}{'model':<24}{'calls':>6}{'latency s':>10}{'prompt':>8}{'compl':>7}{'cost $':>10}")
+    for role, r in report["roles"].items():
+        print(f"  {role:<18}{','.join(r['models']):<24}{r['calls']:>6.1f}{r['latency']:>10.2f}"
+              f"{r['prompt_tokens']:>8.0f}{r['completion_tokens']:>7.0f}{r['cost']:>10.5f}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="conversations per profile set")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--profiles", default="single,routed", help="comma separated: single, routed, <file.json>")
+    parser.add_argument("--scheduler", default="llm", help="local or llm (llm includes the selector calls)")
+    parser.add_argument("--no-scripted", action="store_true", help="let the model say God's line")
+    parser.add_argument("--large-latency", default="0.5,0.03", help="first token, per token seconds of MODEL_NAME")
+    parser.add_argument("--small-latency", default="0.15,0.01", help="the same for SMALL_MODEL_NAME")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds in the stub's own selector flow")
+    return parser
+
+
+async def bench(args) -> list:
+    latency = lambda value: tuple(float(x) for x in value.split(","))  # noqa: E731
+    reports = []
+    with StubOpenAIServer(
+        rounds=args.rounds,
+        model_latency={
+            tm.MODEL_NAME: latency(args.large_latency),
+            tm.SMALL_MODEL_NAME: latency(args.small_latency),
+        },
+    ) as stub:
+        model_client = stub_model_client(stub)
+        for name in args.profiles.split(","):
+            profiles = tm.load_profiles({"single": "off"}.get(name, name))
+            reports.append(await run_profile_set(name, profiles, stub, model_client, args))
+    return reports
+
+
+def main():
+    args = build_parser().parse_args()
+    for report in asyncio.run(bench(args)):
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
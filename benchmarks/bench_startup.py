@@ -0,0 +1,118 @@
+##########################################################
+# benchmarks/bench_startup.py
+##########################################################
+"""
+Measures what a visitor waits for before the page shows up:
+  - cold start: importing time_machine in a fresh interpreter, and for
+    comparison time_machine_agents (the agent framework the app only
+    loads on the first "Run"), with the number of modules each loads
+  - reruns: the first script run of the app and then every rerun after
+    it (a widget interaction), with Streamlit's AppTest (no browser)
+
+Usage:
+    python benchmarks/bench_startup.py --imports 5 --reruns 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": seconds,
+    "modules": len(sys.modules),
+    "agents_loaded": "autogen_agentchat" in sys.modules,
+}}))
+"""
+
+
+def cold_import(module: str) -> dict:
+    """Imports 'module' in a fresh interpreter and returns the probe's report."""
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def bench_imports(runs: int) -> list:
+    reports = []
+    for module in ("time_machine", "time_machine_agents"):
+        probes = [cold_import(module) for _ in range(runs)]
+        reports.append({
+            "module": module,
+            "median_seconds": statistics.median(p["seconds"] for p in probes),
+            "modules": probes[-1]["modules"],
+            "agents_loaded": probes[-1]["agents_loaded"],
+        })
+    return reports
+
+
+def bench_reruns(runs: int) -> dict:
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        sys.exit("streamlit >= 1.28 is required for the rerun timings (streamlit.testing.v1)")
+
+    app = AppTest.from_file(os.path.join(ROOT, "time_machine.py"), default_timeout=60)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+    if app.exception:
+        sys.exit(f"The app failed to start: {app.exception}")
+
+    reruns = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        app.run()
+        reruns.append(time.perf_counter() - started)
+        if app.exception:
+            sys.exit(f"A rerun of the app failed: {app.exception}")
+    return {
+        "first_run_seconds": first,
+        "median_rerun_seconds": statistics.median(reruns),
+        "max_rerun_seconds": max(reruns),
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imports", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--reruns", type=int, default=20, help="reruns after the first script run")
+    parser.add_argument("--no-app", action="store_true", help="only time the imports")
+    parser.add_argument("--json", help="write the reports to this file")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    report = {"imports": bench_imports(args.imports)}
+    print(f"{'import':<24}{'median s':>10}{'modules':>9}  agent framework loaded")
+    for r in report["imports"]:
+        print(f"{r['module']:<24}{r['median_seconds']:>10.3f}{r['modules']:>9}  {r['agents_loaded']}")
+
+    if not args.no_app:
+        report["app"] = bench_reruns(args.reruns)
+        app = report["app"]
+        print(f"\napp: first run {app['first_run_seconds']:.3f} s, "
+              f"rerun median {app['median_rerun_seconds'] * 1000:.1f} ms, max {app['max_rerun_seconds'] * 1000:.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
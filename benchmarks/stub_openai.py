@@ -0,0 +1,418 @@
+##########################################################
+# benchmarks/stub_openai.py
+##########################################################
+"""
+A tiny OpenAI-compatible chat completions server for benchmarks.
+
+It understands just enough of the Time Machine show to keep a
+conversation going: it answers speaker-selection prompts following the
+show's flow, says God's line, lets the Host introduce / ask / conclude
+with "Thank you everyone!", and gives the arguers canned one-liners.
+Replies are delivered at a configurable latency per token, streamed or
+not, and every request is logged for the benchmark to inspect.
+
+To exercise clients under load it can also enforce requests-per-minute
+and tokens-per-minute limits, refilled continuously (answering 429 with
+retry-after and OpenAI's x-ratelimit-* headers, which it also sends on
+every other response), and fail a random
+share of requests with a 429 or 5xx.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+
+ARGUER_LINES = [
+    "I have seen empires rise and fall, and none of them ever agreed with you.",
+    "With all due respect, that idea would not survive a single afternoon in my century.",
+    "History will remember my answer, and it will quietly forget yours.",
+    "Numbers do not lie, my friend, but they do seem to avoid you.",
+    "If I had your tools, I would have finished this debate before breakfast.",
+    "You call that an example? I call it a rough first draft.",
+]
+
+
+# The Host's system prompt asks for at least this many turns from each
+# arguer: once both have had them, a Host turn is the verdict (ShowScheduler
+# only interjects before that), otherwise it is a question.
+VERDICT_TURNS = 5
+
+
+def count_tokens(text: str) -> int:
+    """A rough token count (about four characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class StubOpenAIServer:
+    """
+    Serves POST /v1/chat/completions on a background thread.
+
+    first_token_latency: seconds before the first token of every reply
+    token_latency: seconds per further token
+    model_latency: optional {model: (first_token_latency, token_latency)}
+    rounds: arguer rounds before the stub's own speaker selection hands the
+        Host the verdict (at least VERDICT_TURNS)
+    requests_per_minute / tokens_per_minute: enforced limits (0: none)
+    error_rate: share of requests failed on purpose with 'error_status'
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        first_token_latency: float = 0.2,
+        token_latency: float = 0.01,
+        model_latency: dict = None,
+        rounds: int = 5,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        seed: int = None,
+    ):
+        self.host = host
+        self.port = port
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.model_latency = model_latency or {}
+        self.rounds = rounds
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = []
+        self.rejected = {"rate_limit": 0, "injected": 0}
+        self._random = random.Random(seed)
+        # Budgets left, refilled continuously at the limit per minute like the
+        # real API's; x-ratelimit-reset-* is the time until they are full
+        self._budget = {"requests": float(requests_per_minute), "tokens": float(tokens_per_minute)}
+        self._budget_updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "StubOpenAIServer":
+        ready = threading.Event()
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.host, self.port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name="stub-openai", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def take_rejected(self) -> dict:
+        """How many requests were refused, by reason, since the last call."""
+        with self._lock:
+            taken, self.rejected = self.rejected, {"rate_limit": 0, "injected": 0}
+        return taken
+
+    def take_requests(self) -> list:
+        """The logged requests since the last call."""
+        with self._lock:
+            taken, self.requests = self.requests, []
+        return taken
+
+    ###########################################################################
+    # HTTP
+    ###########################################################################
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+                    await self._send_json(writer, 404, {"error": {"message": f"Unknown endpoint {path}"}})
+                    continue
+                await self._handle_completion(writer, json.loads(body or b"{}"))
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # client gone, or the server is stopping
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer, status: int, payload: dict, extra_headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(body)}"]
+        head += [f"{k}: {v}" for k, v in (extra_headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _send_chunk(self, writer, payload):
+        data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")) + b"\n\n"
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+    ###########################################################################
+    # Completions
+    ###########################################################################
+    def _admit(self, tokens: int, now: float):
+        """
+        Applies the limits to a request of 'tokens' tokens.
+        Returns (status or None, rate-limit headers). A 429 also carries
+        retry-after(-ms): the time until this request would fit.
+        """
+        limits = {"requests": self.requests_per_minute, "tokens": self.tokens_per_minute}
+        needed = {"requests": 1, "tokens": tokens}
+        with self._lock:
+            elapsed = now - self._budget_updated
+            self._budget_updated = now
+            for kind, limit in limits.items():
+                self._budget[kind] = min(limit, self._budget[kind] + elapsed * limit / 60)
+            short = {
+                kind: needed[kind] - self._budget[kind]
+                for kind, limit in limits.items()
+                if limit and needed[kind] > self._budget[kind]
+            }
+            status = None
+            if short:
+                status = 429
+                self.rejected["rate_limit"] += 1
+            elif self.error_rate and self._random.random() < self.error_rate:
+                status = self.error_status
+                self.rejected["injected"] += 1
+            else:
+                for kind in limits:
+                    self._budget[kind] -= needed[kind]
+            budget = dict(self._budget)
+
+        headers = {}
+        for kind, limit in limits.items():
+            if limit:
+                full_in = (limit - budget[kind]) * 60 / limit
+                headers.update({
+                    f"x-ratelimit-limit-{kind}": limit,
+                    f"x-ratelimit-remaining-{kind}": max(0, int(budget[kind])),
+                    f"x-ratelimit-reset-{kind}": f"{full_in:.3f}s",
+                })
+        if short:
+            wait = max(missing * 60 / limits[kind] for kind, missing in short.items())
+            headers["retry-after-ms"] = f"{wait * 1000:.0f}"
+            headers["retry-after"] = f"{wait:.3f}"
+        return status, headers
+
+    async def _handle_completion(self, writer, request: dict):
+        started = time.monotonic()
+        model = request.get("model", "")
+        messages = request.get("messages", [])
+        kind, role, reply = self.reply_for(messages)
+        reply = self.apply_limits(reply, request)
+        first_latency, token_latency = self.model_latency.get(
+            model, (self.first_token_latency, self.token_latency)
+        )
+        words = reply.split(" ")
+        prompt_tokens = sum(count_tokens(str(m.get("content") or "")) for m in messages)
+
+        status, limit_headers = self._admit(prompt_tokens + count_tokens(reply), started)
+        if status is not None:
+            message = "Rate limit reached" if status == 429 else "The server had an error"
+            await self._send_json(writer, status, {"error": {
+                "message": message, "type": "requests", "code": "rate_limit_exceeded" if status == 429 else None,
+            }}, limit_headers)
+            return
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": count_tokens(reply),
+            "total_tokens": prompt_tokens + count_tokens(reply),
+        }
+        completion_id = f"chatcmpl-stub-{int(started * 1e6)}"
+        base = {"id": completion_id, "created": int(time.time()), "model": model}
+
+        await asyncio.sleep(first_latency)
+        if request.get("stream"):
+            head = "".join(f"{k}: {v}\r\n" for k, v in limit_headers.items())
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         + head.encode("latin-1") + b"Transfer-Encoding: chunked\r\n\r\n")
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(token_latency)
+                delta = {"content": word if i == 0 else " " + word}
+                if i == 0:
+                    delta["role"] = "assistant"
+                await self._send_chunk(writer, {**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": None}]})
+            await self._send_chunk(writer, {**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (request.get("stream_options") or {}).get("include_usage"):
+                await self._send_chunk(writer, {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+            await self._send_chunk(writer, b"[DONE]")
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        else:
+            await asyncio.sleep(token_latency * max(0, len(words) - 1))
+            await self._send_json(writer, 200, {**base, "object": "chat.completion", "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }], "usage": usage}, limit_headers)
+
+        with self._lock:
+            self.requests.append({
+                "kind": kind,
+                "role": role,
+                "model": model,
+                "stream": bool(request.get("stream")),
+                "include_usage": bool((request.get("stream_options") or {}).get("include_usage")),
+                "messages": len(messages),
+                "prompt_tokens": usage["prompt_tokens"],
+                "completion_tokens": usage["completion_tokens"],
+                "started": started,
+                "ended": time.monotonic(),
+            })
+
+    @staticmethod
+    def apply_limits(reply: str, request: dict) -> str:
+        """Honours max_tokens and stop like the real API would."""
+        stops = request.get("stop") or []
+        for stop in [stops] if isinstance(stops, str) else stops:
+            if stop and stop in reply:
+                reply = reply[: reply.index(stop)]
+        max_tokens = request.get("max_tokens")
+        if max_tokens:
+            reply = reply[: max_tokens * 4]
+        return reply
+
+    def reply_for(self, messages: list):
+        """Returns (kind, role, reply text) for a chat completion request."""
+        text = "\n".join(str(m.get("content") or "") for m in messages)
+        system = next((str(m.get("content") or "") for m in messages if m.get("role") == "system"), "")
+
+        if "select the next role" in text.lower():
+            return "selector", "selector", self.next_speaker(text)
+
+        if "You are God." in system:
+            match = re.search(r"(My children, let .*? Host, your turn!)", system)
+            return "agent", "God", match.group(1) if match else "My children, speak. Host, your turn!"
+
+        spoken = [m.get("name", "") for m in messages if m.get("role") == "user"]
+        turns1, turns2 = spoken.count("Arguer1"), spoken.count("Arguer2")
+        # The guests' turns folded into a summary by a bounded context window
+        folded = re.search(r"Earlier in the conversation \(\d+ turns: (\d+) by .*?, (\d+) by .*?; summarized\)", text)
+        if folded:
+            turns1 += int(folded.group(1))
+            turns2 += int(folded.group(2))
+        if "You are the conversation Host." in system:
+            guests = re.findall(r"introduce (.*?) \(just this", system)
+            person1 = guests[0] if guests else "Guest one"
+            if turns1 + turns2 == 0:
+                reply = (f"Thanks, God! Today's subtopic is a tricky one. {person1}, your turn: "
+                         "give us an example.")
+            elif min(turns1, turns2) >= VERDICT_TURNS:
+                reply = f"A lively exchange full of bold claims; {person1} wins by a whisker. "
+                if 'write the line "Winner: "' in system:
+                    reply += f"\nWinner: {person1}\n"
+                reply += "Thank you everyone!"
+            else:
+                reply = "Interesting! But can either of you back that up with a real example?"
+            return "agent", "Host", reply
+
+        match = re.search(r"You are (.*?)\.", system)
+        role = match.group(1) if match else "unknown"
+        own_turns = sum(1 for m in messages if m.get("role") == "assistant")
+        return "agent", role, ARGUER_LINES[(own_turns + len(role)) % len(ARGUER_LINES)]
+
+    @staticmethod
+    def selector_history(prompt: str) -> str:
+        """
+        The conversation part of SelectorGroupChat's prompt. The roles list
+        before it has "God: ..." style lines too, which are not turns.
+        """
+        match = re.search(r"Read the following conversation\..*?\n(.*)Read the above conversation", prompt, re.DOTALL)
+        return match.group(1) if match else prompt
+
+    def next_speaker(self, prompt: str) -> str:
+        """Follows the show's flow from the history in a selector prompt."""
+        history = self.selector_history(prompt)
+        spoken = re.findall(r"^(God|Host|Arguer1|Arguer2):", history, flags=re.MULTILINE)
+        turns1, turns2 = spoken.count("Arguer1"), spoken.count("Arguer2")
+        if not spoken:
+            return "God"
+        last = spoken[-1]
+        if last == "God":
+            return "Host"
+        rounds = max(self.rounds, VERDICT_TURNS)
+        if turns1 >= rounds and turns2 >= rounds:
+            return "Host"
+        if last == "Host":
+            return "Arguer1" if turns1 <= turns2 else "Arguer2"
+        return "Arguer2" if last == "Arguer1" else "Arguer1"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the stub OpenAI server in the foreground.")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute to enforce")
+    parser.add_argument("--tpm", type=int, default=0, help="tokens per minute to enforce")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests to fail on purpose")
+    parser.add_argument("--error-status", type=int, default=429)
+    args = parser.parse_args()
+
+    server = StubOpenAIServer(
+        port=args.port,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        rounds=args.rounds,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    ).start()
+    print(f"Stub OpenAI server listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,161 @@
+##########################################################
+# build_avatars.py
+##########################################################
+"""
+Builds the local avatar thumbnails served by the app.
+
+Every avatar URL (people from the catalog, the role avatars and the
+title clock) is fetched once, or ingested from a folder of downloaded
+images, and kept under .avatar_cache/ by content hash, so it is never
+downloaded again. From each image it writes:
+  - static/avatars/<hash>-50.webp and <hash>-100.webp (1x and 2x)
+  - static/avatars/manifest.json: URL => thumbnail paths
+  - static/avatars/bundle.json: URL => 1x thumbnail as a data URI
+
+The app serves static/ itself (see .streamlit/config.toml) and looks
+thumbnails up by URL; it falls back to the remote URL for anything
+missing from the manifest. When the build output is missing, the app
+also runs build() itself once per process, in the background.
+
+Usage:
+    python build_avatars.py                      # fetch what is missing
+    python build_avatars.py --source-dir images  # ingest <imgur id>.png files
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+
+import time_machine as tm
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ROOT, ".avatar_cache")
+SOURCES_INDEX = os.path.join(CACHE_DIR, "sources.json")
+SIZES = (50, 100)
+
+
+def avatar_urls() -> list:
+    urls = list(tm.PERSON_AVATARS.values()) + list(tm.AVATAR_URLS.values()) + [tm.TITLE_IMAGE_URL]
+    return list(dict.fromkeys(urls))
+
+
+def load_json(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def store_source(blob: bytes) -> str:
+    """Keeps the original image by content hash, returns the hash."""
+    digest = hashlib.sha256(blob).hexdigest()[:16]
+    path = os.path.join(CACHE_DIR, digest)
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(blob)
+    return digest
+
+
+def fetch(url: str, timeout: float) -> bytes:
+    request = urllib.request.Request(url, headers={"User-Agent": "time-machine-avatar-build"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def make_thumbnails(digest: str, out_dir: str) -> dict:
+    """Writes the 1x/2x WebP thumbnails of a cached source image."""
+    from PIL import Image, ImageOps
+
+    paths = {}
+    with Image.open(os.path.join(CACHE_DIR, digest)) as image:
+        image = image.convert("RGBA")
+        for scale, size in zip(("1x", "2x"), SIZES):
+            name = f"{digest}-{size}.webp"
+            path = os.path.join(out_dir, name)
+            if not os.path.exists(path):
+                thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                thumb.save(path, "WEBP", quality=85, method=6)
+            paths[scale] = f"avatars/{name}"
+    return paths
+
+
+def data_uri(path: str) -> str:
+    with open(path, "rb") as f:
+        return "data:image/webp;base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+def build(source_dir: str = None, offline: bool = False, timeout: float = 15) -> tuple:
+    """
+    Builds the thumbnails, the manifest and the bundle of every avatar
+    URL. Returns (manifest, missing URLs). Needs Pillow.
+    """
+    out_dir = os.path.join(ROOT, tm.AVATAR_STATIC_DIR)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    os.makedirs(out_dir, exist_ok=True)
+    sources = load_json(SOURCES_INDEX)
+
+    manifest, bundle, missing = {}, {}, []
+    for url in avatar_urls():
+        digest = sources.get(url)
+        if not digest or not os.path.exists(os.path.join(CACHE_DIR, digest)):
+            local = os.path.join(source_dir, os.path.basename(url)) if source_dir else None
+            try:
+                if local and os.path.exists(local):
+                    with open(local, "rb") as f:
+                        digest = store_source(f.read())
+                elif not offline:
+                    digest = store_source(fetch(url, timeout))
+                else:
+                    digest = None
+            except OSError as e:
+                print(f"  ! {url}: {e}", file=sys.stderr)
+                digest = None
+            if digest is None:
+                missing.append(url)
+                continue
+            sources[url] = digest
+            write_json(SOURCES_INDEX, sources)
+
+        paths = make_thumbnails(digest, out_dir)
+        manifest[url] = {"hash": digest, **paths}
+        bundle[url] = data_uri(os.path.join(out_dir, os.path.basename(paths["1x"])))
+
+    write_json(os.path.join(out_dir, "bundle.json"), bundle)
+    # Written last: the app takes the manifest as the sign the build is done
+    write_json(os.path.join(out_dir, "manifest.json"), manifest)
+    return manifest, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source-dir", help="folder of already downloaded images, named like the URL's file name")
+    parser.add_argument("--offline", action="store_true", help="never download, only use cached or ingested images")
+    parser.add_argument("--timeout", type=float, default=15)
+    args = parser.parse_args()
+
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        sys.exit("Pillow is required to build the thumbnails: pip install pillow")
+
+    manifest, missing = build(args.source_dir, args.offline, args.timeout)
+    out_dir = os.path.join(ROOT, tm.AVATAR_STATIC_DIR)
+    size = sum(os.path.getsize(os.path.join(out_dir, os.path.basename(p["1x"]))) for p in manifest.values())
+    print(f"{len(manifest)} avatars built ({size / 1024:.0f} KiB at 1x), {len(missing)} missing")
+    for url in missing:
+        print(f"  missing: {url}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
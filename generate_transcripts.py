@@ -0,0 +1,271 @@
+##########################################################
+# generate_transcripts.py
+##########################################################
+"""
+Generates Time Machine conversations without the app, for content and
+evaluation work.
+
+Conversations run 'concurrency' at a time on one event loop, and each
+transcript is written out as soon as it is finished:
+  - *.jsonl: one JSON object per line, flushed per conversation
+  - *.parquet: a directory of part-NNNNN.parquet files, one per
+    '--row-group' conversations (needs pyarrow)
+
+Every conversation has a stable id, so the output doubles as the
+checkpoint: running the same command again skips the ids already
+written (a half-written last JSONL line is dropped) and carries on.
+
+By default conversation i draws its setup with random.Random(seed + i).
+With --sweep, the ids instead walk the whole person pair x topic x style
+space in a fixed order that spreads consecutive ids across it, so any
+prefix of the sweep is a varied sample and the full sweep covers every
+combination once.
+
+Usage:
+    OPENAI_API_KEY=... python generate_transcripts.py -n 1000 -o out.jsonl --concurrency 16
+    python generate_transcripts.py --sweep -n 500 -o sweep.parquet
+    python generate_transcripts.py -n 20 -o stub.jsonl --base-url http://127.0.0.1:8808/v1
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import time_machine as tm
+
+
+###############################################################################
+# What to generate
+###############################################################################
+class Sweep:
+    """
+    The person pair x topic x style space of a catalog. Pairs are people
+    from two different categories, like PersonaCatalog.pick_pair draws.
+    """
+
+    def __init__(self, catalog: tm.PersonaCatalog):
+        categories = {}
+        for index, members in enumerate(catalog.category_members):
+            for member in members:
+                categories.setdefault(catalog.people[member], set()).add(index)
+        names = [name for name in catalog.people if name in categories]
+        self.pairs = [
+            (a, b)
+            for i, a in enumerate(names)
+            for b in names[i + 1:]
+            if len(categories[a] | categories[b]) > 1
+        ]
+        self.topics = catalog.topics
+        self.styles = catalog.styles
+        self.size = len(self.pairs) * len(self.topics) * len(self.styles)
+        # A stride coprime with the size makes i -> i * stride a permutation
+        self._stride = int(self.size * 0.6180339887) | 1
+        while math.gcd(self._stride, self.size) != 1:
+            self._stride += 1
+
+    def setup(self, index: int) -> tm.ContestSetup:
+        j = (index * self._stride) % self.size
+        pair = self.pairs[j % len(self.pairs)]
+        j //= len(self.pairs)
+        topic = self.topics[j % len(self.topics)]
+        style = self.styles[j // len(self.topics)]
+        return tm.ContestSetup(pair[0], pair[1], topic, style)
+
+
+def random_setup(seed: int) -> tm.ContestSetup:
+    return tm.draw_contest_setup(random.Random(seed))
+
+
+def transcript_record(index: int, seed, transcript: tm.Transcript) -> dict:
+    setup = transcript.setup
+    return {
+        "id": index,
+        "seed": seed,
+        "person1": setup.person1,
+        "person2": setup.person2,
+        "topic": setup.topic,
+        "style": setup.style,
+        "created_at": transcript.created_at,
+        "timings": transcript.timings,
+        "messages": [{"source": m.source, "content": m.content} for m in transcript.messages],
+    }
+
+
+###############################################################################
+# Output writers; each also tells which ids are already written
+###############################################################################
+class JsonlWriter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def done_ids(self) -> set:
+        """Ids in the file; a partial last line (from a crash) is cut off."""
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    break
+                good += len(line)
+        if good < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        return done
+
+    def __enter__(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
+class ParquetWriter:
+    def __init__(self, directory: str, row_group: int):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            sys.exit("pyarrow is required for Parquet output: pip install pyarrow")
+        self.directory = directory
+        self.row_group = row_group
+        self._rows = []
+
+    def _parts(self) -> list:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".parquet"))
+
+    def done_ids(self) -> set:
+        import pyarrow.parquet as pq
+
+        done = set()
+        for name in self._parts():
+            done.update(pq.read_table(os.path.join(self.directory, name), columns=["id"])["id"].to_pylist())
+        return done
+
+    def __enter__(self):
+        os.makedirs(self.directory, exist_ok=True)
+        parts = self._parts()
+        self._next_part = int(parts[-1][5:10]) + 1 if parts else 0
+        return self
+
+    def write(self, record: dict):
+        record = dict(record, timings=json.dumps(record["timings"]))
+        self._rows.append(record)
+        if len(self._rows) >= self.row_group:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return
+        path = os.path.join(self.directory, f"part-{self._next_part:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._rows), path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self._next_part += 1
+        self._rows = []
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def open_writer(path: str, row_group: int):
+    if path.endswith(".jsonl"):
+        return JsonlWriter(path)
+    if path.endswith(".parquet"):
+        return ParquetWriter(path, row_group)
+    sys.exit(f"Unknown output format for {path}: use .jsonl or .parquet")
+
+
+###############################################################################
+# Generation
+###############################################################################
+async def generate(args, model_client, writer, jobs: list):
+    """Runs the jobs (id, seed, setup) 'args.concurrency' at a time."""
+    pending = iter(jobs)
+    finished = failed = 0
+    started = time.monotonic()
+
+    async def worker():
+        nonlocal finished, failed
+        for index, seed, setup in pending:
+            try:
+                transcript = await tm.collect_transcript(setup, model_client)
+            except Exception as e:
+                failed += 1
+                print(f"  ! {index}: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            writer.write(transcript_record(index, seed, transcript))
+            finished += 1
+            if finished % args.progress == 0 or finished == len(jobs):
+                rate = 60 * finished / (time.monotonic() - started)
+                print(f"  {finished}/{len(jobs)} done, {failed} failed ({rate:.1f} conversations/min)")
+
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    return finished, failed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, help="conversations in total (default: 10, or the whole sweep)")
+    parser.add_argument("-o", "--output", default="transcripts.jsonl", help="*.jsonl or *.parquet")
+    parser.add_argument("--concurrency", type=int, default=8, help="conversations running at once")
+    parser.add_argument("--seed", type=int, default=0, help="base seed of the random setups")
+    parser.add_argument("--sweep", action="store_true", help="walk person pair x topic x style instead of sampling")
+    parser.add_argument("--row-group", type=int, default=200, help="conversations per Parquet part file")
+    parser.add_argument("--progress", type=int, default=10, help="print progress every N conversations")
+    parser.add_argument("--cache", default=tm.MODEL_CACHE_MODE, help="off, record, replay or read_through")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. the benchmark stub")
+    parser.add_argument("--no-governor", action="store_true", help="do not shape the model calls")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    if args.sweep:
+        sweep = Sweep(tm.CATALOG)
+        count = min(args.count or sweep.size, sweep.size)
+        jobs = [(i, None, sweep.setup(i)) for i in range(count)]
+        print(f"Sweep of {sweep.size} setups ({len(sweep.pairs)} pairs x {len(sweep.topics)} topics "
+              f"x {len(sweep.styles)} styles), taking the first {count}")
+    else:
+        count = args.count or 10
+        jobs = [(i, args.seed + i, random_setup(args.seed + i)) for i in range(count)]
+
+    writer = open_writer(args.output, args.row_group)
+    done = writer.done_ids()
+    jobs = [job for job in jobs if job[0] not in done]
+    if done:
+        print(f"Resuming: {len(done)} conversations already in {args.output}, {len(jobs)} to go")
+    if not jobs:
+        return
+
+    client_args = {"base_url": args.base_url} if args.base_url else {}
+    model_client = tm.create_model_client(
+        cache_mode=args.cache,
+        governor=None if args.no_governor else tm.create_governor(),
+        api_key=os.environ.get("OPENAI_API_KEY", "stub" if args.base_url else None),
+        **client_args,
+    )
+    with writer:
+        finished, failed = asyncio.run(generate(args, model_client, writer, jobs))
+    print(f"{finished} conversations written to {args.output}, {failed} failed (run again to retry them)")
+
+
+if __name__ == "__main__":
+    main()
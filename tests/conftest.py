@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture(scope="module")
+def stub():
+    from stub_openai import StubOpenAIServer
+
+    with StubOpenAIServer(first_token_latency=0.0, token_latency=0.0) as server:
+        yield server
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+import time_machine as tm
+
+
+def run_contest(stub, **kwargs):
+    async def collect():
+        client = tm.create_model_client(cache_mode="off", api_key="stub", base_url=stub.url)
+        return [
+            step async for step in tm.run_famous_people_contest(
+                client,
+                setup=tm.ContestSetup("Albert Einstein", "Isaac Newton", "gravity", "witty"),
+                max_messages=0,
+                deadline=0,
+                **kwargs,
+            )
+        ]
+
+    return asyncio.run(collect())
+
+
+def texts(steps):
+    return [step.content for step in steps if isinstance(step, tm.TextMessage)]
+
+
+@pytest.mark.parametrize("stream_tokens", [False, True])
+def test_token_budget_stops_the_show(stub, stream_tokens):
+    stub.take_requests()
+    lines = texts(run_contest(stub, stream_tokens=stream_tokens, max_tokens=1500))
+    assert lines[-1].startswith("We are out of time!")
+    requests = stub.take_requests()
+    assert sum(r["prompt_tokens"] + r["completion_tokens"] for r in requests) < 4000
+
+
+def test_streamed_calls_ask_for_the_usage(stub):
+    stub.take_requests()
+    run_contest(stub, stream_tokens=True, max_tokens=1500)
+    streamed = [r for r in stub.take_requests() if r["stream"]]
+    assert streamed and all(r["include_usage"] for r in streamed)
+
+
+def test_show_without_budget_ends_with_the_verdict(stub):
+    lines = texts(run_contest(stub, stream_tokens=True, max_tokens=0))
+    assert "Thank you everyone!" in lines[-1]
+    assert not lines[-1].startswith("We are out of time!")
@@ -0,0 +1,186 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import time_machine as tm
+from stub_openai import StubOpenAIServer
+
+
+class ApiError(Exception):
+    """Looks like an openai.APIStatusError to the governor."""
+
+    def __init__(self, status_code: int, **headers):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers)
+
+
+def governor(**kwargs):
+    args = dict(
+        requests_per_minute=0,
+        tokens_per_minute=0,
+        max_concurrency=4,
+        max_retries=2,
+        breaker_failures=3,
+        breaker_cooldown=30,
+    )
+    return tm.RequestGovernor(**{**args, **kwargs})
+
+
+async def fail(g: tm.RequestGovernor, error: Exception):
+    with pytest.raises(type(error)):
+        async with g.attempt(10, "gpt-4o"):
+            raise error
+
+
+def test_bucket_waits_for_the_refill():
+    bucket = tm.TokenBucket(60)  # one per second
+    now = time.monotonic()
+    bucket.take(60, now)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now + 1.0) == 0.0
+    bucket.give_back(1000)
+    assert bucket.available == 60
+
+
+def test_bucket_calibrates_to_the_reported_reset():
+    bucket = tm.TokenBucket(600)
+    now = time.monotonic()
+    # 300 used, full again in 60 s: 5 per second, slower than 600 per minute
+    bucket.calibrate(600, 300, now, reset=60.0)
+    assert bucket.available == 300
+    assert bucket.rate == pytest.approx(5.0)
+    assert bucket.wait_time(310, now) == pytest.approx(2.0)
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = tm.TokenBucket(0)
+    bucket.take(10**6, time.monotonic())
+    assert bucket.wait_time(10**6, time.monotonic()) == 0.0
+
+
+def test_retry_after_is_honoured_and_capped():
+    g = governor(max_delay=20.0)
+    assert g.retry_after(ApiError(429, **{"retry-after-ms": "1500"})) == pytest.approx(1.5)
+    assert g.retry_after(ApiError(429, **{"retry-after": "3"})) == 3.0
+    assert g.retry_after(ApiError(429, **{"retry-after": "600"})) == 20.0
+    # The reset headers only calibrate the buckets
+    assert g.retry_after(ApiError(429, **{"x-ratelimit-reset-requests": "6m0s"})) == 0.0
+    assert g.backoff(0, ApiError(429, **{"retry-after": "3"})) == 3.0
+    assert 0.0 <= g.backoff(3, ApiError(503)) <= g.base_delay * 2 ** 3
+
+
+def test_retry_delay_gives_up_after_max_retries():
+    g = governor(max_retries=2)
+    error = ApiError(503)
+    g.retry_delay(0, error)
+    g.retry_delay(1, error)
+    with pytest.raises(ApiError):
+        g.retry_delay(2, error)
+    assert (g.retries, g.failed) == (2, 1)
+    # Not retryable: raised at once
+    with pytest.raises(ApiError):
+        g.retry_delay(0, ApiError(400))
+
+
+def test_breaker_opens_fails_fast_and_lets_one_trial_through():
+    g = governor(breaker_failures=3, breaker_cooldown=30)
+
+    async def scenario():
+        for _ in range(3):
+            await fail(g, ApiError(503))
+        assert g.state == "open"
+        with pytest.raises(tm.ModelUnavailableError):
+            async with g.attempt(10, "gpt-4o"):
+                pass
+        assert g.rejected == 1
+
+        g._opened_at = time.monotonic() - 31  # the cooldown is over
+        assert g.state == "half_open"
+        async with g.attempt(10, "gpt-4o"):
+            # Only the trial call goes through
+            with pytest.raises(tm.ModelUnavailableError):
+                async with g.attempt(10, "gpt-4o"):
+                    pass
+        assert g.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_failed_trial_reopens_the_breaker():
+    g = governor(breaker_failures=1, breaker_cooldown=30)
+
+    async def scenario():
+        await fail(g, ApiError(503))
+        g._opened_at = time.monotonic() - 31
+        await fail(g, ApiError(503))
+        assert g.state == "open"
+        assert isinstance(g.open_error(), tm.ModelUnavailableError)
+
+    asyncio.run(scenario())
+
+
+def test_throttling_halves_the_concurrency():
+    g = governor(max_concurrency=8)
+
+    async def scenario():
+        await fail(g, ApiError(429))
+        assert g.concurrency == 4
+        await fail(g, ApiError(500))  # not a throttle
+        assert g.concurrency == 4
+        async with g.attempt(10, "gpt-4o"):
+            pass
+        assert g.concurrency == pytest.approx(4.25)
+
+    asyncio.run(scenario())
+
+
+def test_settle_gives_back_unused_tokens_only_with_usage():
+    g = governor(tokens_per_minute=1000)
+
+    async def scenario():
+        async with g.attempt(400, "gpt-4o"):
+            pass
+
+    asyncio.run(scenario())
+    tokens = g.buckets("gpt-4o")[1]
+    before = tokens.available
+    g.settle(400, None, "gpt-4o")
+    assert tokens.available == before
+    g.settle(400, SimpleNamespace(prompt_tokens=80, completion_tokens=20), "gpt-4o")
+    assert tokens.available == pytest.approx(before + 300, abs=1)
+
+
+def test_buckets_are_per_model():
+    g = governor(requests_per_minute=60)
+    g.observe_headers({"x-ratelimit-limit-requests": "60", "x-ratelimit-remaining-requests": "0"}, "gpt-4o")
+    assert g.buckets("gpt-4o")[0].available == 0
+    assert g.buckets("gpt-4o-mini")[0].available == 60
+
+
+def test_a_show_broken_off_by_failed_calls_raises():
+    with StubOpenAIServer(first_token_latency=0.0, token_latency=0.0, error_rate=1.0, error_status=500) as stub:
+        client = tm.create_model_client(cache_mode="off", api_key="stub", base_url=stub.url, max_retries=0)
+
+        async def run():
+            return [step async for step in tm.run_famous_people_contest(client, stream_tokens=False)]
+
+        with pytest.raises(tm.ConversationFailedError):
+            asyncio.run(run())
+
+
+def test_a_model_waiting_for_its_buckets_does_not_hold_up_another():
+    g = governor(requests_per_minute=60)
+
+    async def scenario():
+        g.buckets("gpt-4o")[0].take(60, time.monotonic())  # about a second until the next call
+        waiting = asyncio.ensure_future(g._acquire(1, "gpt-4o"))
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(g._acquire(1, "gpt-4o-mini"), timeout=0.5)
+        assert not waiting.done()
+        waiting.cancel()
+
+    asyncio.run(scenario())
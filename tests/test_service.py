@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+import time_machine as tm
+from stub_openai import StubOpenAIServer
+
+SETUP = tm.ContestSetup("Albert Einstein", "Isaac Newton", "gravity", "witty")
+
+
+@pytest.fixture(scope="module")
+def slow_stub():
+    # Slow enough that the rest of the show would take seconds
+    with StubOpenAIServer(first_token_latency=0.1, token_latency=0.0) as server:
+        yield server
+
+
+@pytest.mark.parametrize("stream_tokens", [False, True])
+def test_closing_the_stream_stops_the_conversation(slow_stub, stream_tokens):
+    stub = slow_stub
+    service = tm.ConversationService(tm.ConversationRuntime(), max_concurrency=2)
+    client = tm.create_model_client(cache_mode="off", api_key="stub", base_url=stub.url)
+
+    def contest():
+        return tm.run_famous_people_contest(client, setup=SETUP, stream_tokens=stream_tokens)
+
+    stream = service.stream("session", contest)
+    messages = 0
+    for step in stream:
+        messages += not isinstance(step, tm.TokenChunk)
+        if messages == 4:
+            break
+    stream.close()
+
+    for _ in range(10):
+        if service.running == 0:
+            break
+        time.sleep(0.05)
+    assert service.running == 0
+    left = time.monotonic()
+    time.sleep(1.5)
+    # Calls already on the wire still arrive, but no new one starts
+    # (the stub takes 0.1 s per reply)
+    assert [r for r in stub.take_requests() if r["started"] > left + 0.05] == []
+
+
+def refill(pool: tm.ConversationPool):
+    pool.refill()
+    for _ in range(200):
+        time.sleep(0.05)
+        if not pool._refilling:
+            return
+
+
+def test_pool_only_keeps_complete_conversations(stub):
+    client = tm.create_model_client(cache_mode="off", api_key="stub", base_url=stub.url)
+    pool = tm.ConversationPool(tm.ConversationRuntime(), client, capacity=2, low_water=1)
+    refill(pool)
+    assert len(pool) == 2
+    assert all(tm.is_complete(pool.pop()) for _ in range(2))
+
+
+def test_pool_rejects_conversations_cut_short():
+    with StubOpenAIServer(first_token_latency=0.0, token_latency=0.0, error_rate=1.0, error_status=500) as stub:
+        client = tm.create_model_client(cache_mode="off", api_key="stub", base_url=stub.url, max_retries=0)
+        pool = tm.ConversationPool(tm.ConversationRuntime(), client, capacity=2, low_water=1)
+        refill(pool)
+    assert len(pool) == 0
+    assert pool.failed == 2 and pool.generated == 0
+
+
+def test_transcript_without_closing_line_is_incomplete():
+    setup = tm.ContestSetup("Albert Einstein", "Isaac Newton", "gravity", "witty")
+    cut_short = tm.Transcript(setup, [tm.ChatRecord("user", "Dear God, please speak!"),
+                                      tm.ChatRecord("God", "My children...")], 0.0)
+    assert not tm.is_complete(cut_short)
+    wrapped_up = tm.Transcript(setup, cut_short.messages + [
+        tm.ChatRecord("Host", tm.wrap_up_line("Albert Einstein", "Isaac Newton", "gravity", 2, 1))], 0.0)
+    assert tm.is_complete(wrapped_up)
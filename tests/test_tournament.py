@@ -0,0 +1,142 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+import time_machine as tm
+
+
+def winner(person1, person2, verdict, turns=(5, 5)):
+    records = (
+        [tm.ChatRecord("Arguer1", "...")] * turns[0]
+        + [tm.ChatRecord("Arguer2", "...")] * turns[1]
+        + ([tm.ChatRecord("Host", verdict)] if verdict is not None else [])
+    )
+    return tm.verdict_winner(tm.ContestSetup(person1, person2, "topic", "witty"), records)
+
+
+def test_winner_line_decides():
+    verdict = "Einstein was sharp and Newton was sharper.\nWinner: Isaac Newton\nThank you everyone!"
+    assert winner("Albert Einstein", "Isaac Newton", verdict) == "Isaac Newton"
+
+
+def test_name_nearest_the_winner_keyword():
+    verdict = "What a duel! The winner is Einstein, not Newton. Thank you everyone!"
+    assert winner("Albert Einstein", "Isaac Newton", verdict) == "Albert Einstein"
+    verdict = "Einstein was brilliant, but the winner is Newton. Thank you everyone!"
+    assert winner("Albert Einstein", "Isaac Newton", verdict) == "Isaac Newton"
+
+
+@pytest.mark.parametrize("verdict", [
+    "The winner is Cleopatra, though he gave her a fight. Thank you everyone!",
+    "Zheng He sailed far, but the winner is Cleopatra. Thank you everyone!",
+    "Cleopatra wins; the helmsman could not keep up. Thank you everyone!",
+])
+def test_short_names_match_whole_words_only(verdict):
+    assert winner("Zheng He", "Cleopatra", verdict) == "Cleopatra"
+
+
+def test_short_name_matches_as_full_name():
+    verdict = "Cleopatra was regal, but the winner is Zheng He. Thank you everyone!"
+    assert winner("Zheng He", "Cleopatra", verdict) == "Zheng He"
+
+
+def test_wrap_up_line_names_the_winner():
+    verdict = tm.wrap_up_line("Albert Einstein", "Isaac Newton", "gravity", 3, 4)
+    assert winner("Albert Einstein", "Isaac Newton", verdict, turns=(3, 4)) == "Isaac Newton"
+
+
+def test_without_verdict_more_turns_wins():
+    assert winner("Albert Einstein", "Isaac Newton", None, turns=(3, 4)) == "Isaac Newton"
+
+
+def test_round_takes_a_seat_per_match():
+    runtime = tm.ConversationRuntime()
+    service = tm.ConversationService(runtime, max_concurrency=4)
+    release = asyncio.Event()
+
+    async def round_of_matches():
+        yield "started"
+        await release.wait()
+
+    async def one_conversation():
+        yield "started"
+
+    positions = []
+    tournament = service.stream("tournament", round_of_matches, seats=3)
+    assert next(tournament) == "started"
+    assert service.running == 3
+
+    waiting = threading.Thread(
+        target=lambda: list(service.stream("visitor", one_conversation, positions.append, seats=2))
+    )
+    waiting.start()
+    time.sleep(0.5)
+    assert positions == [1] and service.running == 3
+
+    runtime.loop.call_soon_threadsafe(release.set)
+    assert list(tournament) == []
+    waiting.join(5)
+    assert positions == [1, 0] and service.running == 0
+
+
+@pytest.mark.parametrize("size", [2, 3, 4, 5, 8])
+def test_bracket_seeds_size_different_people(size):
+    for seed in range(20):
+        people = tm.seed_bracket(size, random.Random(seed))
+        assert len(people) == size
+        assert len(set(people)) == size
+
+
+def test_bracket_can_take_the_whole_catalog():
+    size = len(tm.CATALOG.people)
+    assert sorted(tm.seed_bracket(size, random.Random(1))) == sorted(tm.CATALOG.people)
+
+
+@pytest.mark.parametrize("size", [0, 1, len(tm.CATALOG.people) + 1])
+def test_bracket_size_is_checked(size):
+    with pytest.raises(ValueError):
+        tm.seed_bracket(size)
+
+
+def test_matches_name_their_winner_on_a_line_of_its_own(stub):
+    setups = [
+        tm.ContestSetup("Albert Einstein", "Isaac Newton", "gravity", "witty"),
+        tm.ContestSetup("Zheng He", "Cleopatra", "ships", "serious"),
+    ]
+
+    async def play():
+        client = tm.create_model_client(cache_mode="off", api_key="stub", base_url=stub.url)
+        return [item async for item in tm.run_matches(client, setups, concurrency=2)]
+
+    steps = asyncio.run(play())
+    for index, setup in enumerate(setups):
+        records = tm.step_records(step for i, step in steps if i == index)
+        assert f"Winner: {setup.person1}" in records[-1].content
+        assert tm.verdict_winner(setup, records) == setup.person1
+
+
+def test_leaving_a_round_stops_every_match():
+    from stub_openai import StubOpenAIServer
+
+    setups = [tm.ContestSetup("Albert Einstein", "Isaac Newton", "gravity", "witty")] * 2
+    with StubOpenAIServer(first_token_latency=0.1, token_latency=0.0) as stub:
+
+        async def leave_early():
+            client = tm.create_model_client(cache_mode="off", api_key="stub", base_url=stub.url)
+            matches = tm.run_matches(client, setups, concurrency=2)
+            seen = 0
+            async for _ in matches:
+                seen += 1
+                if seen == 6:
+                    break
+            await matches.aclose()
+            left = time.monotonic()
+            await asyncio.sleep(1.5)
+            # Calls already on the wire still arrive, but no new one starts
+            # (the stub takes 0.1 s per reply)
+            return [r for r in stub.take_requests() if r["started"] > left + 0.05]
+
+        assert asyncio.run(leave_early()) == []
@@ -1,438 +1,1587 @@
 ##########################################################
 # time_machine.py
 ##########################################################
+import streamlit as st
+
+if __name__ == "__main__":
+    # Streamlit executes this file as __main__ on every rerun. Everything
+    # below is defined once per process in the importable time_machine
+    # module (cached in sys.modules), so a rerun only draws the page. The
+    # script's folder is not always on sys.path (e.g. under AppTest), and
+    # time_machine_agents imports time_machine too, so it is added first.
+    import importlib
+    import os
+    import sys
+
+    _here = os.path.dirname(os.path.abspath(__file__))
+    if _here not in sys.path:
+        sys.path.insert(0, _here)
+    importlib.import_module("time_machine").main()
+    st.stop()
+
 import os
 import random
 import asyncio
+import collections
+import json
+import queue
 import re
-import streamlit as st
-
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.teams import SelectorGroupChat
-from autogen_agentchat.conditions import TextMentionTermination
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from types import MappingProxyType
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from autogen_core.models import ChatCompletionClient
+
+# The agent framework (autogen and the OpenAI client) is only imported by
+# time_machine_agents, on the first "Run"; see agents().
 
 ###############################################################################
-# 1) Lists of famous individuals by category
+# 0) Settings
 ###############################################################################
-FAMOUS_PHYSICISTS = [
-    "Albert Einstein",
-    "Richard Feynman",
-    "Marie Curie",
-    "Stephen Hawking",
-    "Isaac Newton",
-    "Niels Bohr",
-    "Erwin Schrödinger",
-    "Oppenheimer",
-]
-
-FAMOUS_POLITICIANS = [
-    "Donald Trump", "Donald Trump",  # Weighted
-    "Barack Obama",
-    "Winston Churchill",
-    "Abraham Lincoln",
-    "Margaret Thatcher",
-    "Angela Merkel",
-    "Mahatma Gandhi",
-    "Franklin D. Roosevelt",
-    "Julius Caesar",
-]
-
-FAMOUS_MATHEMATICIANS = [
-    "Alan Turing",
-    "Ada Lovelace",
-    "Leonhard Euler",
-    "Carl Friedrich Gauss",
-    "Euclid",
-    "Srinivasa Ramanujan",
-]
-
-FAMOUS_PHILOSOPHERS = [
-    "Donald Trump", "Donald Trump",  # Weighted
-    "Plato",
-    "Aristotle",
-    "Friedrich Nietzsche",
-    "Immanuel Kant",
-    "Michel Foucault",
-    "Simone de Beauvoir",
-]
-
-FAMOUS_SPORTS_PEOPLE = [
-    "Michael Jordan",
-    "Muhammad Ali",
-    "Serena Williams",
-    "Lionel Messi",
-    "Roger Federer",
-    "Cristiano Ronaldo",
-]
-
-FAMOUS_CELEBRITIES = [
-    "Oprah Winfrey",
-    "Kim Kardashian",
-    "Dwayne Johnson",
-    "Taylor Swift",
-    "Beyoncé",
-    "Tom Hanks",
-]
-
-FAMOUS_US_PRESIDENTS = [
-    "Donald Trump", "Donald Trump",  # Weighted
-    "George Washington",
-    "Thomas Jefferson",
-    "Theodore Roosevelt",
-    "John F. Kennedy",
-    "Joe Biden",
-]
-
-OTHER = [
-    "Donald Trump", "Donald Trump",  # Weighted
-    "William Shakespeare",
-    "Leonardo da Vinci",
-    "Napoleon Bonaparte",
-    "Cleopatra",
-    "Alexander the Great",
-    "Genghis Khan",
-]
-
-FAMOUS_ASTRONAUTS = [
-    "Neil Armstrong",
-    "Buzz Aldrin",
-    "Yuri Gagarin",
-    "Sally Ride",
-    "Chris Hadfield",
-]
-
-FAMOUS_EXPLORERS = [
-    "Christopher Columbus",
-    "Marco Polo",
-    "Ferdinand Magellan",
-    "Zheng He",
-    "Roald Amundsen",
-]
-
-FAMOUS_COMPOSERS = [
-    "Ludwig van Beethoven",
-    "Wolfgang Amadeus Mozart",
-    "Johann Sebastian Bach",
-    "Frédéric Chopin",
-    "Pyotr Tchaikovsky",
-]
-
-ALL_CATEGORIES = [
-    FAMOUS_PHYSICISTS,
-    FAMOUS_POLITICIANS,
-    FAMOUS_MATHEMATICIANS,
-    FAMOUS_PHILOSOPHERS,
-    FAMOUS_SPORTS_PEOPLE,
-    FAMOUS_CELEBRITIES,
-    FAMOUS_US_PRESIDENTS,
-    OTHER,
-    FAMOUS_ASTRONAUTS,
-    FAMOUS_EXPLORERS,
-    FAMOUS_COMPOSERS,
-]
+# Draw each message as soon as the agents produce it ("1"), or only once the
+# whole conversation has finished ("0").
+LIVE_RENDERING = os.environ.get("TIME_MACHINE_LIVE", "1") != "0"
+
+# Stream each utterance token by token into its bubble ("1"), or draw it
+# once the agent's completion has finished ("0"). Needs LIVE_RENDERING.
+STREAM_TOKENS = os.environ.get("TIME_MACHINE_STREAM_TOKENS", "1") != "0"
+
+# Minimum time between two redraws of a bubble that is still streaming
+STREAM_REFRESH_SECONDS = 0.05
+
+# Who speaks next: "local" follows the fixed flow of the show without any
+# model call, "llm" lets SelectorGroupChat ask the model every turn.
+TURN_SCHEDULER = os.environ.get("TIME_MACHINE_SCHEDULER", "local")
+
+# Say God's fixed line and the guests' facts locally ("1") instead of
+# having the model produce them ("0").
+SCRIPTED_TURNS = os.environ.get("TIME_MACHINE_SCRIPTED", "1") != "0"
+
+# Conversations generated ahead of demand, so "Run" can show one instantly.
+# 0 disables the pool. Refill starts when fewer than POOL_LOW_WATER are
+# ready; entries older than POOL_MAX_AGE seconds are dropped.
+POOL_SIZE = int(os.environ.get("TIME_MACHINE_POOL_SIZE", "0"))
+POOL_LOW_WATER = int(os.environ.get("TIME_MACHINE_POOL_LOW_WATER", str(POOL_SIZE // 2)))
+POOL_MAX_AGE = float(os.environ.get("TIME_MACHINE_POOL_MAX_AGE", "3600"))
+POOL_CONCURRENCY = int(os.environ.get("TIME_MACHINE_POOL_CONCURRENCY", "2"))
+
+# How many conversations may run at the same time in this process; further
+# "Run" presses wait in line, first come first served.
+MAX_CONCURRENT_CONVERSATIONS = int(os.environ.get("TIME_MACHINE_MAX_CONVERSATIONS", "4"))
+
+MODEL_NAME = "gpt-4o"
+MODEL_TEMPERATURE = 1
+
+# Per-role generation profiles (see GenerationProfile): "off" sends
+# everything to MODEL_NAME uncapped, as before; "routed" sends speaker
+# selection, God and the Host's questions and verdict to SMALL_MODEL_NAME
+# and caps every role's completion length, which is cheaper and faster but
+# changes the shows (see the README); anything else is a JSON file of
+# overrides of the routed profiles.
+SMALL_MODEL_NAME = os.environ.get("TIME_MACHINE_SMALL_MODEL", "gpt-4o-mini")
+PROFILES_SETTING = os.environ.get("TIME_MACHINE_PROFILES", "off")
+
+# Cache of model responses on disk: "off", "record" (always call the model
+# and store the answer), "replay" (only answer from the cache, never call
+# the model) or "read_through" (answer from the cache, call on a miss).
+MODEL_CACHE_MODE = os.environ.get("TIME_MACHINE_MODEL_CACHE", "off")
+MODEL_CACHE_DIR = os.environ.get("TIME_MACHINE_MODEL_CACHE_DIR", ".model_cache")
+MODEL_CACHE_MAX_MB = float(os.environ.get("TIME_MACHINE_MODEL_CACHE_MAX_MB", "200"))
+
+# Client-side shaping of the model calls (see RequestGovernor). The rate
+# limits are only starting points: they follow the x-ratelimit-* headers of
+# OpenAI's responses. 0 disables a limit; TIME_MACHINE_GOVERNOR=0 disables
+# the governor.
+MODEL_GOVERNOR = os.environ.get("TIME_MACHINE_GOVERNOR", "1") != "0"
+MODEL_REQUESTS_PER_MINUTE = float(os.environ.get("TIME_MACHINE_RPM", "500"))
+MODEL_TOKENS_PER_MINUTE = float(os.environ.get("TIME_MACHINE_TPM", "30000"))
+MODEL_MAX_CONCURRENCY = int(os.environ.get("TIME_MACHINE_MODEL_CONCURRENCY", "8"))
+MODEL_MAX_RETRIES = int(os.environ.get("TIME_MACHINE_MODEL_RETRIES", "4"))
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30.0
+
+# Agents see at most this many recent utterances; older turns are folded
+# into a short running summary (see ContextWindowModelClient). The Host
+# sees twice as many, to give its verdict. 0 sends the full history.
+CONTEXT_WINDOW = int(os.environ.get("TIME_MACHINE_CONTEXT_WINDOW", "0"))
+
+# Overlap model calls that do not depend on each other: both guests'
+# opening examples are generated at once, and with the "llm" scheduler the
+# other arguer's reply is started while the selector decides ("1").
+PIPELINED_TURNS = os.environ.get("TIME_MACHINE_PIPELINE", "1") != "0"
+
+# Hard limits per conversation: messages, prompt + completion tokens and
+# wall-clock seconds. When one runs out, the Host closes the show with a
+# templated verdict. 0 disables a limit.
+MAX_MESSAGES = int(os.environ.get("TIME_MACHINE_MAX_MESSAGES", "40"))
+MAX_CONVERSATION_TOKENS = int(os.environ.get("TIME_MACHINE_MAX_TOKENS", "80000"))
+CONVERSATION_DEADLINE = float(os.environ.get("TIME_MACHINE_DEADLINE", "180"))
+
+# How many recently shown people a session avoids when drawing guests
+SESSION_NO_REPEAT = int(os.environ.get("TIME_MACHINE_NO_REPEAT", "6"))
+
+# Tournament mode: a knockout bracket of this many people (best a power of
+# two, otherwise the last one of an odd round gets a bye; below 2 hides
+# the button; at most the catalog's size), and how many of a round's
+# matches run at once
+TOURNAMENT_SIZE = int(os.environ.get("TIME_MACHINE_TOURNAMENT_SIZE", "4"))
+TOURNAMENT_CONCURRENCY = int(os.environ.get("TIME_MACHINE_TOURNAMENT_CONCURRENCY", "4"))
+
+# Where avatar pictures come from: "static" (thumbnails built by
+# build_avatars.py and served by the app), "inline" (the same thumbnails
+# as data URIs) or "remote" (the original full-size URLs).
+AVATAR_MODE = os.environ.get("TIME_MACHINE_AVATARS", "static")
+
+# Every conversation shown is appended to this SQLite archive ("" disables
+# it). With ARCHIVE_SERVE, a drawn matchup (people and topic) that is
+# already archived is shown from there instead of being generated again.
+ARCHIVE_PATH = os.environ.get("TIME_MACHINE_ARCHIVE", "transcripts.sqlite3")
+ARCHIVE_SERVE = os.environ.get("TIME_MACHINE_ARCHIVE_SERVE", "0") == "1"
+HISTORY_PAGE_SIZE = 10
+
+# Show the "Debug: Trace" panel under each conversation
+DEBUG_PANEL = os.environ.get("TIME_MACHINE_DEBUG", "0") == "1"
+
+# If set, every conversation's spans are appended to TRACE_DIR/trace.jsonl
+# and the process-wide counters are written to TRACE_DIR/metrics.prom
+TRACE_DIR = os.environ.get("TIME_MACHINE_TRACE_DIR", "")
 
 ###############################################################################
-# 2) Topics
+# 1) The persona catalog: people, categories, avatars, facts, topics, styles
 ###############################################################################
-UNEXPECTED_TOPICS = [
-    "conspiracy theories",
-    "paradoxes",
-    "riddles",
-    "unbelievable facts",
-    "human psychology",
-    "challenges and experiments",
-    "controversial topics",
-    "how-to guides",
-    "content creators",
-    "social media platforms",
-    "history with irony",
-    "fun facts that sound unbelievable",
-    "statistical facts",
-    "polarizing topics",
-    "escape room strategies",
-    "war strategies",
-    "the meaning or plot of a book",
-    "escape prison scenarios",
-    "hypothetical situations",
-    "quirks in legal systems",
-    "food and unusual dishes",
-    "would you rather scenarios",
-    "simple probability theory",
-    "simple riddles",
-    "math puzzles",
-    "historical facts",
-    "trivia questions",
-    "corporate dynamics",
-    "startup strategies",
-    "negotiating a big contract",
-    "diplomatic negotiations",
-    "debating for a presidential seat",
-    "religious doctrines",
-    "family vacation plans",
-    "doctor-patient disagreements",
-    "sci-fi concepts",
-    "the best movies or TV shows",
-    "video games",
-    "art styles",
-    "music genres",
-    "technology trends",
-    "famous quotes",
-    "World War II"
-]
+# The data lives in personas.json, so the roster can grow without code
+# changes. It is loaded once per process into an immutable PersonaCatalog.
+CATALOG_PATH = os.environ.get(
+    "TIME_MACHINE_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "personas.json")
+)
+
+
+class AliasTable:
+    """
+    Weighted sampling in O(1) per draw (Vose's alias method).
+    Built once in O(n) from the weights; sample() returns an index.
+    """
+
+    __slots__ = ("_prob", "_alias")
+
+    def __init__(self, weights):
+        n = len(weights)
+        if n == 0:
+            raise ValueError("AliasTable needs at least one weight")
+        total = float(sum(weights))
+        scaled = [w * n / total for w in weights]
+        prob = [0.0] * n
+        alias = list(range(n))
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            prob[i] = 1.0
+        self._prob = tuple(prob)
+        self._alias = tuple(alias)
+
+    def __len__(self):
+        return len(self._prob)
+
+    def sample(self, rng=random) -> int:
+        i = int(rng.random() * len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+
+@dataclass(frozen=True)
+class PersonaCatalog:
+    """
+    Everything the show draws from, indexed for sampling.
+    People are referred to by their position in 'people'; every category
+    holds a tuple of those positions and its own alias table, so a
+    person's weight applies within each category they belong to.
+    """
+    people: tuple
+    avatars: dict
+    facts: dict
+    category_names: tuple
+    category_members: tuple
+    topics: tuple
+    styles: tuple
+    category_table: AliasTable
+    member_tables: tuple
+    topic_table: AliasTable
+    style_table: AliasTable
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PersonaCatalog":
+        people = tuple(data["people"])
+        position = {name: i for i, name in enumerate(people)}
+        weights = [float(data["people"][name].get("weight", 1)) for name in people]
+
+        category_names = tuple(data["categories"])
+        category_members = tuple(
+            tuple(position[name] for name in data["categories"][category])
+            for category in category_names
+        )
+
+        avatars = {name: info["avatar"] for name, info in data["people"].items() if info.get("avatar")}
+        avatars.update(data.get("extra_avatars", {}))
+        facts = {name: info["facts"] for name, info in data["people"].items() if info.get("facts")}
+
+        topics = data["topics"]
+        if isinstance(topics, dict):
+            topic_names, topic_weights = tuple(topics), list(topics.values())
+        else:
+            topic_names, topic_weights = tuple(topics), [1] * len(topics)
+        styles = data["styles"]
+
+        return cls(
+            people=people,
+            avatars=MappingProxyType(avatars),
+            facts=MappingProxyType(facts),
+            category_names=category_names,
+            category_members=category_members,
+            topics=topic_names,
+            styles=tuple(styles),
+            category_table=AliasTable([float(data.get("category_weights", {}).get(c, 1)) for c in category_names]),
+            member_tables=tuple(AliasTable([weights[i] for i in members]) for members in category_members),
+            topic_table=AliasTable(topic_weights),
+            style_table=AliasTable(list(styles.values())),
+        )
+
+    def pick_pair(self, rng=random, exclude=(), attempts: int = 50) -> tuple:
+        """
+        Two different people from two different categories.
+        People in 'exclude' are avoided while that is still possible.
+        """
+        if len(self.category_names) < 2:
+            raise ValueError("The catalog needs at least two categories")
+        for attempt in range(attempts):
+            # Give up on 'exclude' halfway rather than looping forever
+            avoid = exclude if attempt < attempts // 2 else ()
+            cat1 = self.category_table.sample(rng)
+            cat2 = self.category_table.sample(rng)
+            if cat1 == cat2:
+                continue
+            person1 = self.people[self.category_members[cat1][self.member_tables[cat1].sample(rng)]]
+            person2 = self.people[self.category_members[cat2][self.member_tables[cat2].sample(rng)]]
+            if person1 != person2 and person1 not in avoid and person2 not in avoid:
+                return person1, person2
+        raise RuntimeError("Could not draw two different people from the catalog")
+
+    def pick_person(self, rng=random, exclude=(), attempts: int = 50) -> str:
+        """One person who is not in 'exclude', drawn like one side of a pair."""
+        for _ in range(attempts):
+            category = self.category_table.sample(rng)
+            person = self.people[self.category_members[category][self.member_tables[category].sample(rng)]]
+            if person not in exclude:
+                return person
+        remaining = [person for person in self.people if person not in exclude]
+        if not remaining:
+            raise ValueError("Everyone in the catalog is excluded")
+        return rng.choice(remaining)
+
+    def pick_topic(self, rng=random) -> str:
+        return self.topics[self.topic_table.sample(rng)]
+
+    def pick_style(self, rng=random) -> str:
+        return self.styles[self.style_table.sample(rng)]
+
+
+@st.cache_resource(show_spinner=False)
+def load_catalog(path: str = CATALOG_PATH) -> PersonaCatalog:
+    """Reads the catalog file once per process."""
+    with open(path, encoding="utf-8") as f:
+        return PersonaCatalog.from_dict(json.load(f))
+
+
+CATALOG = load_catalog(CATALOG_PATH)
+
+# Person name => avatar URL, and person name => "born-died year, who they are"
+PERSON_AVATARS = CATALOG.avatars
+PERSONA_FACTS = CATALOG.facts
+UNEXPECTED_TOPICS = CATALOG.topics
+
+if TOURNAMENT_SIZE > len(CATALOG.people):
+    raise ValueError(
+        f"TIME_MACHINE_TOURNAMENT_SIZE is {TOURNAMENT_SIZE}, but the catalog has only {len(CATALOG.people)} people"
+    )
 
 ###############################################################################
 # 3) Helper functions
 ###############################################################################
-def pick_two_people() -> tuple[str, str]:
-    random.shuffle(ALL_CATEGORIES)
-    chosen = []
-    used_categories = set()
-
-    while len(chosen) < 2:
-        cat = random.choice(ALL_CATEGORIES)
-        if tuple(cat) not in used_categories:
-            used_categories.add(tuple(cat))
-            pick = random.choice(cat)
-
-            # If we pick Donald Trump, remove him from all categories
-            if pick == "Donald Trump":
-                # For each category list in ALL_CATEGORIES,
-                # remove Donald Trump if it exists.
-                for category_list in ALL_CATEGORIES:
-                    while "Donald Trump" in category_list:
-                        category_list.remove("Donald Trump")
-
-            chosen.append(pick)
-
-    return chosen[0], chosen[1]
-
-
-def pick_random_topic() -> str:
-    return random.choice(UNEXPECTED_TOPICS)
-
-def decide_style() -> str:
-    val = random.random()
-    if val < 0.4:
-        return "witty"
-    elif val < 0.6:
-        return "serious"
-    elif val < 0.85:
-        return "competitive"
-    else:
-        return "moderate"
+def pick_two_people(rng=random, exclude=()) -> tuple[str, str]:
+    return CATALOG.pick_pair(rng, exclude)
+
+
+def pick_random_topic(rng=random) -> str:
+    return CATALOG.pick_topic(rng)
+
+
+def persona_facts(person: str) -> str:
+    """What the Host should say about a guest (fallback: let the model recall it)."""
+    return PERSONA_FACTS.get(person, "born-died year, who they are")
+
+
+def god_line(person1: str, person2: str, topic: str, style: str) -> str:
+    """The one line God always says to open the show."""
+    return f"My children, let {person1} and {person2} converse about '{topic}' with a {style} flavor. Host, your turn!"
+
+
+# The Host's last words in every show, the verdict's or a budget wrap-up's
+CLOSING_LINE = "Thank you everyone!"
+
+
+def wrap_up_line(person1: str, person2: str, topic: str, turns1: int, turns2: int) -> str:
+    """The Host's closing line when a conversation runs out of budget."""
+    winner = person1 if turns1 >= turns2 else person2
+    return (
+        f"We are out of time! {person1} and {person2} traded {turns1 + turns2} lines about '{topic}', "
+        f"and by a whisker the last word goes to {winner}. {CLOSING_LINE}"
+    )
+
+
+def decide_style(rng=random) -> str:
+    # witty 40%, serious 20%, competitive 25%, moderate 15% by default
+    return CATALOG.pick_style(rng)
+
+
+@dataclass(frozen=True)
+class ContestSetup:
+    """Who is talking, about what, and in which style."""
+    person1: str
+    person2: str
+    topic: str
+    style: str
+
+
+def draw_contest_setup(rng=random, exclude=()) -> ContestSetup:
+    """A random setup; people in 'exclude' are avoided where possible."""
+    person1, person2 = pick_two_people(rng, exclude)
+    return ContestSetup(person1, person2, pick_random_topic(rng), decide_style(rng))
+
+
+@dataclass(frozen=True)
+class ChatRecord:
+    """One finished message of a conversation."""
+    source: str
+    content: str
+
+
+@dataclass
+class Transcript:
+    """A finished conversation."""
+    setup: ContestSetup
+    messages: list
+    created_at: float
+    # e.g. wall_seconds, first_message_seconds
+    timings: dict = field(default_factory=dict)
+    # Set once the transcript is stored in the TranscriptArchive
+    archive_id: int = None
+
+
+def is_complete(transcript: Transcript) -> bool:
+    """Whether 'transcript' ends with the Host's closing line, not cut short."""
+    return bool(transcript.messages) and transcript.messages[-1].source == "Host" \
+        and CLOSING_LINE in transcript.messages[-1].content
+
+
+def step_records(steps) -> list:
+    """The finished messages among conversation steps, as ChatRecords."""
+    return [
+        ChatRecord(source=getattr(step, "source", ""), content=step.content)
+        for step in steps
+        if not isinstance(step, TokenChunk) and isinstance(getattr(step, "content", None), str)
+    ]
 
 ###############################################################################
-# 4) The main multi-agent function
+# 3a) Speaker scheduling
 ###############################################################################
-async def run_famous_people_contest():
+ARGUERS = ("Arguer1", "Arguer2")
+SPEAKERS = ("God", "Host") + ARGUERS
+
+
+class ShowScheduler:
     """
-    We are going to have a short conversation between:
-      - God (one-line)
-      - Host (introduces two famous people & give a short verdict)
-      - Two arguers
+    Picks the next speaker locally, following the fixed flow of the show:
+    God, Host, then Arguer1/Arguer2 taking turns for 'rounds' rounds, with
+    a Host interjection after each round listed in 'interjections', then
+    the Host's verdict.
+    Used as SelectorGroupChat's selector_func, so no model call is needed
+    to choose who speaks. 'selections' counts the calls saved that way.
     """
-    model_client = OpenAIChatCompletionClient(
-        api_key=st.secrets["openai"]["OPENAI_API_KEY"],
-        model="gpt-4o",
-        temperature=1
-    )
 
-    person1, person2 = pick_two_people()
-    topic = pick_random_topic()
-    style = decide_style()
+    def __init__(self, rounds: int, interjections=()):
+        self.rounds = rounds
+        self.interjections = set(interjections)
+        self.phase = "god"
+        self.selections = 0
+
+    @classmethod
+    def random(cls) -> "ShowScheduler":
+        rounds = random.randint(5, 9)
+        # Optionally one Host question, early enough that the Host
+        # (who waits for at least 5 turns each) won't take it as the verdict
+        interjections = [random.randint(2, 4)] if random.random() < 0.5 else []
+        return cls(rounds, interjections)
+
+    def __call__(self, messages) -> str:
+        self.selections += 1
+        spoken = [getattr(m, "source", "") for m in messages]
+        spoken = [s for s in spoken if s in SPEAKERS]
+        turns1 = spoken.count("Arguer1")
+        turns2 = spoken.count("Arguer2")
+
+        if not spoken:
+            self.phase = "god"
+            return "God"
+        last = spoken[-1]
+
+        if last == "God":
+            self.phase = "intro"
+            return "Host"
+
+        if last == "Host":
+            # After the intro or a question, the arguer who is behind speaks;
+            # after the verdict (without the closing phrase) the Host goes on.
+            if turns1 >= self.rounds and turns2 >= self.rounds:
+                self.phase = "verdict"
+                return "Host"
+            self.phase = "debate"
+            return "Arguer1" if turns1 <= turns2 else "Arguer2"
+
+        if turns1 >= self.rounds and turns2 >= self.rounds:
+            self.phase = "verdict"
+            return "Host"
+        if last == "Arguer2" and turns2 in self.interjections:
+            self.phase = "interjection"
+            return "Host"
+        self.phase = "debate"
+        return "Arguer2" if last == "Arguer1" else "Arguer1"
 
-    # 1) God
-    god_system_message = f"""
-You are God. You will be prompted by the words "Dear God, please speak!" Your reply should be as follows:
-Output exactly one short line, then remain silent:
 
-My children, let {person1} and {person2} converse about '{topic}' with a {style} flavor. Host, your turn!
+###############################################################################
+# 4) Token chunks and the request governor
+###############################################################################
+@dataclass
+class TokenChunk:
+    """A piece of an utterance that is still being generated."""
+    source: str
+    content: str
 
-Remain absolutely silent afterward.
-"""
-    god_agent = AssistantAgent(
-        name="God",
-        description="A deity that briefly introduces the conversation, then is silent.",
-        system_message=god_system_message,
-        model_client=model_client,
-        tools=[]
-    )
 
-    # 2) Host
-    host_system_message = f"""
-You are the conversation Host.
-Your tasks:
-1) Wait for the God to speak. God will introduce guests and the topic, and say "Host, your turn!". It means it's your time to speak.
-2) Choose a subtopic of {topic}. It should be something specific, interesting or controversial. For example, if the topic is "riddles", you must give a riddle. If the topic is "would you rather", you must pose a specific "would you rather" question. But you can also let them converse about the topic in general, for example if the topic is 'debating for a presidential seat', let them pretend they are debating.
-3) Thank God saying "Thanks, God!". Then very briefly introduce {person1} (just this: born-died year, who they are) and {person2} (just this: born-died year, who they are) and mention the topic or subtopic you've invented.
-4) Prompt {person1} and {person2} to speak about the subtopic: ask them to give example. Remind everyone that the conversation should be {style}. Start just with "{person1}, your turn."
-5) You can ask one or two questions per conversation to keep the conversation going.
-6) Allow for a meaningful exchange. At least 5 turns/utterances from each arguer, up to 9, no more.
-7) You must wait until {person1} and {person2} (arguers) exchange At least 5 turns/utterances (from each arguer), up to 9, no more.
-8) Summarize the conversation in one short sentence, then declare a winner in one short sentence.
-7) Say "Thank you everyone!". This will mark the end of the conversation.
-Once you said "Thank you everyone", the conversation is OVER and nobody speaks. Stay silent.
-Stay succinct.
-If one {person1} or {person2} is Donald Trump, remember he is the current US president.
+class ModelUnavailableError(Exception):
+    """Raised without calling the model while the circuit breaker is open."""
 
-"""
-    host_agent = AssistantAgent(
-        name="Host",
-        description="Introduces conversation, gives a verdict, ends the show with THE_END.",
-        system_message=host_system_message,
-        model_client=model_client,
-        tools=[]
-    )
+    def __init__(self, retry_in: float):
+        self.retry_in = retry_in
+        super().__init__(
+            "The time machine is overloaded right now: OpenAI keeps refusing or timing out. "
+            f"Please press Run again in about {max(1, round(retry_in))} seconds."
+        )
 
-    # 3) Arguer1
-    arguer1_system_message = f"""
-You are {person1}.
-You are conversing with {person2} and the Host. about '{topic}' in a {style} style.
-Stay succinct.
-Start with giving an example that Host asked you about.
-Your speech should be short. 
-Speak in one-liners.
-Most important rule: use speech to mimic the {person1} actual speech.
-Speak totally like {person1} would speak.
-Roast {person2}.
-Don't use too many exclamation marks.
-Mostly give your honest opinion about the topic or raise interesting facts.
-Avoid asking questions.
-The most important rule: use speech to mimic the {person1} actual speech. Speak totally like {person1} would speak.
-Try to outshine {person2} if it seems competitive.
-Stay in character, referencing your historical context.
-If you died before something was known, ask about it.
-Avoid "Ah" in your speech
-If you are Donald Trump, make bold statements appealing to the imagination.
-When the Host gives the verdict stay absolutely silent. The conversation is over.
-"""
-    arguer1_agent = AssistantAgent(
-        name="Arguer1",
-        description=f"Represents {person1}",
-        system_message=arguer1_system_message,
-        model_client=model_client,
-        tools=[]
-    )
 
-    # 4) Arguer2
-    arguer2_system_message = f"""
-You are {person2}.
-You are conversing with {person1} about '{topic}' in a {style} style.
-Stay succinct.
-Your speech should be short. 
-Speak in one-liners.
-The most important rule: use speech to mimic the {person2} actual speech. Speak totally like {person2} would speak.
-Roast {person1}.
-Be competitive and reasonably disagree with {person1} statements.
-Mostly give your honest opinion about the topic or raise interesting facts.
-Avoid asking questions.
-Don't use too many exclamation marks.
-You can be a bit crazy or make wild statements but still - stay in character, referencing your historical context.
-If you died before something was known, ask about it.
-Avoid "Ah" in your speech
-If you are Donald Trump, make bold statements appealing to the imagination.
-When the Host gives the verdict, stay absolutely silent. The conversation is over.
-"""
-    arguer2_agent = AssistantAgent(
-        name="Arguer2",
-        description=f"Represents {person2}",
-        system_message=arguer2_system_message,
-        model_client=model_client,
-        tools=[]
+class ConversationFailedError(Exception):
+    """Raised when a show ends without the Host's verdict and no budget ran out."""
+
+    def __init__(self):
+        super().__init__(
+            "The conversation broke off before the Host's verdict: a model call failed. "
+            "Please press Run again."
+        )
+
+
+def _parse_reset(value: str) -> float:
+    """Seconds in an x-ratelimit-reset-* header such as "6m0s" or "20ms"."""
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", value or "")
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+class TokenBucket:
+    """
+    A budget of 'per_minute' units, refilled continuously (at most at
+    'per_minute' / 60 units per second). 0 means no limit.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60  # units per second
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.per_minute:
+            elapsed = now - self._updated
+            self.available = min(self.per_minute, self.available + elapsed * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until 'amount' units are available."""
+        if not self.per_minute:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.per_minute) - self.available
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float):
+        if self.per_minute:
+            self._refill(now)
+            self.available -= amount
+
+    def give_back(self, amount: float):
+        if self.per_minute:
+            self.available = min(self.per_minute, self.available + amount)
+
+    def calibrate(self, limit: float, remaining: float, now: float, reset: float = 0.0):
+        """
+        Follows the limit and remaining budget reported by the API. 'reset'
+        (seconds until the budget is full again) slows the refill down
+        when the API refills more slowly than limit per minute.
+        """
+        self._refill(now)
+        self.per_minute = limit
+        self.available = min(limit, remaining)
+        self.rate = limit / 60
+        if reset > 0 and remaining < limit:
+            self.rate = min(self.rate, (limit - remaining) / reset)
+
+
+class RequestGovernor:
+    """
+    Shapes the model calls of the whole process:
+      - token buckets for requests and tokens per minute, per model (each
+        model has its own limits), calibrated from the x-ratelimit-*
+        headers of that model's responses
+      - an AIMD limit on concurrent calls: +1 per window of successes,
+        halved on every 429 or timeout
+      - retries of 429s, timeouts and 5xx with jittered exponential backoff
+        (at least the server's retry-after)
+      - a circuit breaker: after 'breaker_failures' failed calls in a row it
+        opens for 'breaker_cooldown' seconds and every call fails fast with
+        ModelUnavailableError, then lets one trial call through
+    It must only be used on one event loop.
+    """
+
+    RETRY_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int,
+        max_retries: int,
+        breaker_failures: int,
+        breaker_cooldown: float,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._buckets = {}  # model => (requests, tokens)
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = float(self.max_concurrency)
+        self.max_retries = max_retries
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._in_flight = 0
+        self._admission = {}  # model => asyncio.Lock, created on the loop
+        self._slot_freed = None
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        # Metrics
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failed = 0
+        self.rejected = 0
+        self.waited_seconds = 0.0
+
+    ###########################################################################
+    # Calibration
+    ###########################################################################
+    def buckets(self, model: str) -> tuple:
+        """The (requests, tokens) buckets of 'model', starting at the configured limits."""
+        if model not in self._buckets:
+            self._buckets[model] = (TokenBucket(self.requests_per_minute), TokenBucket(self.tokens_per_minute))
+        return self._buckets[model]
+
+    def observe_headers(self, headers, model: str):
+        """Adopts the rate limits reported in the headers of a response of 'model'."""
+        now = time.monotonic()
+        for bucket, kind in zip(self.buckets(model), ("requests", "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if limit and remaining:
+                try:
+                    reset = _parse_reset(headers.get(f"x-ratelimit-reset-{kind}", ""))
+                    bucket.calibrate(float(limit), float(remaining), now, reset)
+                except ValueError:
+                    pass
+
+    def retry_after(self, error: Exception) -> float:
+        """
+        The wait the server asked for in retry-after-ms or retry-after, if
+        any, at most 'max_delay'. The x-ratelimit-reset-* headers tell when
+        the whole window is full again (often minutes), not when the next
+        call fits; they only calibrate the buckets.
+        """
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            try:
+                return min(self.max_delay, max(0.0, float(headers.get(name, "")) * scale))
+            except ValueError:
+                continue
+        return 0.0
+
+    def is_retryable(self, error: Exception) -> bool:
+        import openai  # loaded with the model client by then
+
+        if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+        return getattr(error, "status_code", None) in self.RETRY_STATUS
+
+    ###########################################################################
+    # Circuit breaker
+    ###########################################################################
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.breaker_cooldown:
+            return "open"
+        return "half_open"
+
+    def _check_breaker(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial):
+            self.rejected += 1
+            raise self.open_error()
+        if state == "half_open":
+            self._trial = True  # only this call goes through
+
+    def _record(self, ok: bool):
+        self._trial = False
+        if ok:
+            self._failures = 0
+            self._opened_at = None
+        else:
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.breaker_failures:
+                self._opened_at = time.monotonic()
+
+    ###########################################################################
+    # Admission
+    ###########################################################################
+    async def _acquire(self, tokens: float, model: str):
+        requests_bucket, tokens_bucket = self.buckets(model)
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Event()
+        if model not in self._admission:
+            self._admission[model] = asyncio.Lock()
+        started = time.monotonic()
+        # Callers of one model are admitted in arrival order; a model waiting
+        # for its buckets to refill does not hold up the others
+        async with self._admission[model]:
+            while True:
+                now = time.monotonic()
+                wait = max(requests_bucket.wait_time(1, now), tokens_bucket.wait_time(tokens, now))
+                if wait <= 0 and self._in_flight < int(self.concurrency):
+                    break
+                self._slot_freed.clear()
+                try:
+                    await asyncio.wait_for(self._slot_freed.wait(), timeout=wait or None)
+                except asyncio.TimeoutError:
+                    pass
+            now = time.monotonic()
+            requests_bucket.take(1, now)
+            tokens_bucket.take(tokens, now)
+            self._in_flight += 1
+        self.waited_seconds += time.monotonic() - started
+
+    def _release(self):
+        self._in_flight -= 1
+        self._slot_freed.set()
+
+    def _adjust(self, error: Exception = None):
+        import openai
+
+        if error is None:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+        elif isinstance(error, asyncio.TimeoutError) or getattr(error, "status_code", None) in (408, 429) \
+                or isinstance(error, openai.APITimeoutError):
+            self.throttled += 1
+            self.concurrency = max(1.0, self.concurrency / 2)
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Full jitter: uniform in [0, base * 2^attempt], but not below retry-after (both at most max_delay)."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return max(random.uniform(0, ceiling), self.retry_after(error))
+
+    @asynccontextmanager
+    async def attempt(self, tokens: float, model: str):
+        """
+        One attempt of a model call of 'tokens' tokens to 'model': waits for
+        its limits and a concurrency slot, holds the slot
+        while the body runs and records how it went. Fails fast with
+        ModelUnavailableError while the breaker is open.
+        """
+        self._check_breaker()
+        await self._acquire(tokens, model)
+        self.calls += 1
+        try:
+            yield
+        except asyncio.CancelledError:
+            self._trial = False
+            raise
+        except Exception as e:
+            retryable = self.is_retryable(e)
+            if retryable:
+                self._adjust(e)
+            self._record(ok=not retryable)  # other errors still mean the API answered
+            raise
+        else:
+            self._adjust()
+            self._record(ok=True)
+        finally:
+            self._release()
+
+    def retry_delay(self, number: int, error: Exception) -> float:
+        """
+        After failed attempt 'number' (from 0): the seconds to wait before
+        the next one. Re-raises the error when it should not be retried.
+        """
+        if not self.is_retryable(error):
+            raise error
+        if number >= self.max_retries or self.state == "open":
+            self.failed += 1
+            unavailable = self.open_error()
+            if unavailable is not None:
+                raise unavailable from error
+            raise error
+        self.retries += 1
+        return self.backoff(number, error)
+
+    def open_error(self):
+        """A ModelUnavailableError while the breaker is open, else None."""
+        if self.state == "closed":
+            return None
+        return ModelUnavailableError(max(1.0, self.breaker_cooldown - (time.monotonic() - self._opened_at)))
+
+    def settle(self, estimated: float, usage, model: str):
+        """Gives back the tokens that were reserved for 'model' but not used."""
+        used = sum(_usage_tokens(usage))
+        if used:  # without usage, the reservation stands
+            self.buckets(model)[1].give_back(estimated - used)
+
+    def metrics(self) -> dict:
+        return {
+            "state": self.state,
+            "concurrency": round(self.concurrency, 2),
+            "in_flight": self._in_flight,
+            "models": {
+                model: {
+                    "requests_per_minute": requests.per_minute,
+                    "requests_available": round(requests.available, 1),
+                    "tokens_per_minute": tokens.per_minute,
+                    "tokens_available": round(tokens.available),
+                }
+                for model, (requests, tokens) in self._buckets.items()
+            },
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "waited_seconds": round(self.waited_seconds, 2),
+        }
+
+
+_STREAM_DONE = object()
+
+
+###############################################################################
+# 4a) Tracing
+###############################################################################
+@dataclass
+class Span:
+    """One timed step of a conversation: a model call, a turn or a render."""
+    name: str
+    agent: str
+    start: float
+    duration: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    attrs: dict = field(default_factory=dict)
+
+
+class TraceMetrics:
+    """
+    Process-wide counters over all spans, per span name and agent,
+    rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(lambda: [0, 0.0, 0, 0, 0.0])
+
+    def observe(self, span: Span):
+        with self._lock:
+            counter = self._counters[(span.name, span.agent)]
+            counter[0] += 1
+            counter[1] += span.duration
+            counter[2] += span.prompt_tokens
+            counter[3] += span.completion_tokens
+            counter[4] = max(counter[4], span.duration)
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+        metrics = [
+            ("time_machine_spans_total", "counter", "Number of spans.", 0),
+            ("time_machine_span_seconds_total", "counter", "Total time spent in spans.", 1),
+            ("time_machine_prompt_tokens_total", "counter", "Prompt tokens sent to the model.", 2),
+            ("time_machine_completion_tokens_total", "counter", "Completion tokens received.", 3),
+            ("time_machine_span_seconds_max", "gauge", "Longest span so far.", 4),
+        ]
+        lines = []
+        for metric, kind, help_text, i in metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for (name, agent), counter in counters:
+                lines.append(f'{metric}{{span="{name}",agent="{agent}"}} {counter[i]}')
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """
+    Collects the spans of one conversation. Spans are added from the
+    runtime loop (model calls, turns) and the script thread (renders).
+    """
+
+    def __init__(self, metrics: TraceMetrics = None):
+        self.conversation_id = uuid.uuid4().hex[:12]
+        self.spans = []
+        self._metrics = metrics
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+        if self._metrics is not None:
+            self._metrics.observe(span)
+
+    @contextmanager
+    def span(self, name: str, agent: str = "", **attrs):
+        """Times the 'with' block; the yielded Span can be filled in."""
+        record = Span(name=name, agent=agent, start=time.time(), attrs=attrs)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.duration = time.perf_counter() - started
+            self.add(record)
+
+    def summary(self) -> list:
+        """Count, time and tokens per span name and agent."""
+        rows = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = rows.setdefault((span.name, span.agent), {
+                "span": span.name, "agent": span.agent, "count": 0,
+                "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            row["count"] += 1
+            row["seconds"] += span.duration
+            row["prompt_tokens"] += span.prompt_tokens
+            row["completion_tokens"] += span.completion_tokens
+        return list(rows.values())
+
+    def to_jsonl(self) -> str:
+        with self._lock:
+            spans = list(self.spans)
+        return "".join(
+            json.dumps({"conversation_id": self.conversation_id, **asdict(span)}, ensure_ascii=False) + "\n"
+            for span in spans
+        )
+
+    def write_jsonl(self, path: str):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
+
+
+def _usage_tokens(usage):
+    if usage is None:
+        return 0, 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+###############################################################################
+# 4b) Long-lived runtime shared by all sessions
+###############################################################################
+class ConversationRuntime:
+    """
+    One event loop running in a background thread for the whole process.
+    Sessions submit their conversation coroutines to it instead of creating
+    and closing a loop on every run, so the shared model client and its
+    HTTP connections stay alive between conversations and across sessions.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="time-machine-runtime", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedules 'coro' on the runtime loop, returns a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """Runs 'coro' on the runtime loop and waits for its result."""
+        return self.submit(coro).result()
+
+
+def create_governor() -> RequestGovernor:
+    return RequestGovernor(
+        requests_per_minute=MODEL_REQUESTS_PER_MINUTE,
+        tokens_per_minute=MODEL_TOKENS_PER_MINUTE,
+        max_concurrency=MODEL_MAX_CONCURRENCY,
+        max_retries=MODEL_MAX_RETRIES,
+        breaker_failures=BREAKER_FAILURES,
+        breaker_cooldown=BREAKER_COOLDOWN,
     )
 
 
-    # 5) Termination after "Thank you everyone!"
-    termination_condition = TextMentionTermination("Thank you everyone!")
-    participants = [god_agent, host_agent, arguer1_agent, arguer2_agent]
+@st.cache_resource
+def get_runtime() -> ConversationRuntime:
+    """The process-wide runtime, created on first use."""
+    return ConversationRuntime()
+
+
+@st.cache_resource
+def get_trace_metrics() -> TraceMetrics:
+    """The process-wide span counters."""
+    return TraceMetrics()
+
+
+@st.cache_resource
+def get_governor():
+    """The process-wide request governor, or None if disabled."""
+    return create_governor() if MODEL_GOVERNOR else None
 
-    chat = SelectorGroupChat(
-        participants=participants,
-        model_client=model_client,
-        allow_repeated_speaker=True,
-        termination_condition=termination_condition
+
+@st.cache_resource
+def get_model_client() -> "ChatCompletionClient":
+    """
+    The process-wide model client. It must only be used on the runtime's
+    loop, which owns its connection pool and the governor.
+    """
+    return agents().create_model_client(governor=get_governor())
+
+
+###############################################################################
+# 4c) The agents, imported on first use
+###############################################################################
+def agents():
+    """
+    The time_machine_agents module: the autogen agents and team, the model
+    client and its wrappers. Importing it loads the agent framework, so it
+    is only done when a conversation is about to run.
+    """
+    import time_machine_agents
+
+    return time_machine_agents
+
+
+def __getattr__(name: str):
+    # tm.run_famous_people_contest & co. keep working for scripts
+    # importing this module; they load the agent side on first access.
+    if name.startswith("__"):
+        raise AttributeError(name)
+    try:
+        return getattr(agents(), name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+
+###############################################################################
+# 4d) Pool of conversations generated ahead of demand
+###############################################################################
+class ConversationPool:
+    """
+    A bounded store of finished conversations, generated before anyone
+    asks for them. Whenever fewer than 'low_water' are ready, a refill task
+    on the runtime loop generates conversations ('concurrency' at a time)
+    until 'capacity' is reached. Entries leave the pool once served or
+    once they are older than 'max_age' seconds.
+    """
+
+    def __init__(
+        self,
+        runtime: ConversationRuntime,
+        model_client: "ChatCompletionClient",
+        capacity: int,
+        low_water: int,
+        max_age: float = 3600,
+        concurrency: int = 2,
+    ):
+        self._runtime = runtime
+        self._model_client = model_client
+        self.capacity = capacity
+        self.low_water = low_water
+        self.max_age = max_age
+        self.concurrency = max(1, concurrency)
+        self._ready = collections.deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failed = 0
+        self.expired = 0
+        self._refill_seconds = 0.0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ready)
+
+    def _evict_expired(self):
+        # Called with the lock held; the oldest entries are on the left
+        cutoff = time.time() - self.max_age
+        while self._ready and self._ready[0].created_at < cutoff:
+            self._ready.popleft()
+            self.expired += 1
+
+    def pop(self):
+        """A ready conversation, or None if the pool is empty."""
+        with self._lock:
+            self._evict_expired()
+            if self._ready:
+                self.hits += 1
+                transcript = self._ready.popleft()
+            else:
+                self.misses += 1
+                transcript = None
+            low = len(self._ready) < self.low_water
+        if low:
+            self.refill()
+        return transcript
+
+    def refill(self):
+        """Starts a refill task unless one is already running."""
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        self._runtime.submit(self._refill())
+
+    async def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    self._evict_expired()
+                    missing = self.capacity - len(self._ready)
+                if missing <= 0:
+                    break
+
+                started = time.monotonic()
+                batch = min(missing, self.concurrency)
+                results = await asyncio.gather(
+                    *[agents().collect_transcript(model_client=self._model_client) for _ in range(batch)],
+                    return_exceptions=True,
+                )
+                self._refill_seconds += time.monotonic() - started
+
+                # A show cut short (e.g. the API is down) is no conversation to serve
+                done = [r for r in results if isinstance(r, Transcript) and is_complete(r)]
+                with self._lock:
+                    self._ready.extend(done)
+                    self.generated += len(done)
+                    self.failed += batch - len(done)
+                if not done:
+                    break  # e.g. the API is down; try again on the next pop()
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def metrics(self) -> dict:
+        served = self.hits + self.misses
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / served if served else 0.0,
+            "generated": self.generated,
+            "failed": self.failed,
+            "expired": self.expired,
+            # Finished conversations per minute of refill time
+            "refill_throughput": 60 * self.generated / self._refill_seconds if self._refill_seconds else 0.0,
+        }
+
+
+@st.cache_resource
+def get_pool():
+    """The process-wide conversation pool, or None if POOL_SIZE is 0."""
+    if POOL_SIZE <= 0:
+        return None
+    pool = ConversationPool(
+        get_runtime(),
+        get_model_client(),
+        capacity=POOL_SIZE,
+        low_water=POOL_LOW_WATER,
+        max_age=POOL_MAX_AGE,
+        concurrency=POOL_CONCURRENCY,
     )
+    pool.refill()
+    return pool
+
+###############################################################################
+# 4e) Admission of conversations from all sessions
+###############################################################################
+_ADMITTED = object()
+
+
+class _Ticket:
+    """A session's place in line for one conversation of 'seats' slots."""
+
+    def __init__(self, session_id: str, seats: int = 1):
+        self.session_id = session_id
+        self.seats = seats
+        self.future = None  # resolved on the loop when a slot is granted
+        self.admitted = False
+
+
+class ConversationService:
+    """
+    Runs the conversations of all sessions on the shared runtime, at most
+    'max_concurrency' at a time. Requests beyond that wait in a FIFO line.
+    A request that runs several conversations at once (a tournament round)
+    takes that many seats. A session has at most one conversation: pressing "Run" again cancels
+    the previous one, and so does the session going away (the script
+    stops consuming the stream).
+    """
+
+    def __init__(self, runtime: ConversationRuntime, max_concurrency: int):
+        self._runtime = runtime
+        self.max_concurrency = max(1, max_concurrency)
+        self._running = 0
+        self._waiters = collections.deque()  # only changed on the loop
+        self._sessions = {}
+        self._lock = threading.Lock()
+        # Metrics
+        self.admitted = 0
+        self.cancelled = 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def position(self, ticket: _Ticket) -> int:
+        """1 for the next in line, 0 once admitted."""
+        if ticket.admitted:
+            return 0
+        for _ in range(3):
+            try:
+                return list(self._waiters).index(ticket) + 1
+            except RuntimeError:
+                continue  # the deque changed while copying it
+            except ValueError:
+                return 1  # not queued yet
+        return 1
+
+    async def _acquire(self, ticket: _Ticket):
+        if self._running + ticket.seats <= self.max_concurrency and not self._waiters:
+            self._running += ticket.seats
+            ticket.admitted = True
+            return
+        ticket.future = self._runtime.loop.create_future()
+        self._waiters.append(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+            raise
+
+    def _release(self, seats: int):
+        self._running -= seats
+        # Admit from the head of the line for as long as the seats suffice
+        while self._waiters and self._running + self._waiters[0].seats <= self.max_concurrency:
+            ticket = self._waiters.popleft()
+            if not ticket.future.done():
+                self._running += ticket.seats
+                ticket.admitted = True
+                ticket.future.set_result(True)
+
+    async def _run(self, ticket: _Ticket, agen_factory, items: queue.Queue):
+        try:
+            await self._acquire(ticket)
+            self.admitted += 1
+            items.put(_ADMITTED)
+            agen = agen_factory()
+            try:
+                async for item in agen:
+                    items.put(item)
+            finally:
+                await agen.aclose()
+        except Exception as e:
+            items.put(e)
+        finally:
+            if ticket.admitted:
+                self._release(ticket.seats)
+            items.put(_STREAM_DONE)
+
+    def stream(self, session_id: str, agen_factory, on_position=None, seats: int = 1):
+        """
+        Runs the async generator made by 'agen_factory' once admitted, and
+        yields its items in the calling thread. While waiting, and once
+        when admitted (position 0), 'on_position' gets the place in line.
+        'seats' is how many conversations the generator runs at once (at
+        most max_concurrency are reserved).
+        """
+        ticket = _Ticket(session_id, max(1, min(seats, self.max_concurrency)))
+        items = queue.Queue()
+        future = self._runtime.submit(self._run(ticket, agen_factory, items))
+        with self._lock:
+            previous = self._sessions.get(session_id)
+            self._sessions[session_id] = future
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.cancelled += 1
+
+        last_position = None
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=0.25)
+                except queue.Empty:
+                    item = None
+                if item is None or item is _ADMITTED:
+                    # Nothing to show yet: report the place in line
+                    position = self.position(ticket)
+                    if on_position is not None and position != last_position:
+                        on_position(position)
+                    last_position = position
+                    continue
+                if item is _STREAM_DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+            with self._lock:
+                if self._sessions.get(session_id) is future:
+                    del self._sessions[session_id]
+
+
+@st.cache_resource
+def get_service() -> ConversationService:
+    """The process-wide conversation service."""
+    return ConversationService(get_runtime(), MAX_CONCURRENT_CONVERSATIONS)
 
-    async for msg in chat.run_stream(task="Dear God, please speak!"):
-        yield msg  # yield each conversation step
 
 ###############################################################################
-# 5) AVATARS (No names displayed, only pictures)
+# 4f) Archive of finished conversations
 ###############################################################################
+class TranscriptArchive:
+    """
+    Append-only SQLite store of finished conversations, indexed by the
+    people, the topic and the date. Listing returns summaries only; the
+    messages of a conversation are loaded when it is opened.
+    """
 
-PERSON_AVATARS = {
-    "Donald Trump": "https://i.imgur.com/FF1UnJt.png",
-    "Albert Einstein": "https://i.imgur.com/VlYjBCE.png",
-    "Richard Feynman": "https://i.imgur.com/pi6CkQ9.png",
-    "Marie Curie": "https://i.imgur.com/bBBj2Yd.png",
-    "Stephen Hawking": "https://i.imgur.com/UcsDCo2.png",
-    "Isaac Newton": "https://i.imgur.com/Fj42ELr.png",
-    "Niels Bohr": "https://i.imgur.com/XkG9MgM.png",
-    "Erwin Schrödinger": "https://i.imgur.com/F6rVVko.png",
-    "Oppenheimer": "https://i.imgur.com/P2FF1Yn.png",
-    "Barack Obama": "https://i.imgur.com/VZW3azA.png",
-    "Winston Churchill": "https://i.imgur.com/0C4U7iv.png",
-    "Abraham Lincoln": "https://i.imgur.com/ft8Pqwm.png",
-    "Margaret Thatcher": "https://i.imgur.com/6uuKmiP.png",
-    "Angela Merkel": "https://i.imgur.com/xlwwdDM.png",
-    "Mahatma Gandhi": "https://i.imgur.com/Jd2IQXJ.png",
-    "Franklin D. Roosevelt": "https://i.imgur.com/9XgOxfa.png",
-    "Julius Caesar": "https://i.imgur.com/9ZrgIRd.png",
-    "Caesar": "https://i.imgur.com/Y5gKpvk.png",
-    "Alan Turing": "https://i.imgur.com/uHOx6kw.png",
-    "Ada Lovelace": "https://i.imgur.com/Bjs0TvK.png",
-    "Leonhard Euler": "https://i.imgur.com/fJi4AFr.png",
-    "Carl Friedrich Gauss": "https://i.imgur.com/4rXZUtT.png",
-    "Euclid": "https://i.imgur.com/Z11H8MG.png",
-    "Srinivasa Ramanujan": "https://i.imgur.com/oBe2DZE.png",
-    "Plato": "https://i.imgur.com/XWynulJ.png",
-    "Aristotle": "https://i.imgur.com/Eeq9gDD.png",
-    "Friedrich Nietzsche": "https://i.imgur.com/GDszfpY.png",
-    "Immanuel Kant": "https://i.imgur.com/esQxvli.png",
-    "Michel Foucault": "https://i.imgur.com/5LUMRQ0.png",
-    "Simone de Beauvoir": "https://i.imgur.com/7be3b4E.png",
-    "Michael Jordan": "https://i.imgur.com/ZzFfT15.png",
-    "Muhammad Ali": "https://i.imgur.com/obAA3wW.png",
-    "Serena Williams": "https://i.imgur.com/pRwoOUy.png",
-    "Lionel Messi": "https://i.imgur.com/znVNvDC.png",
-    "Roger Federer": "https://i.imgur.com/ajEJYAM.png",
-    "Cristiano Ronaldo": "https://i.imgur.com/aiv1mF4.png",
-    "Oprah Winfrey": "https://i.imgur.com/vr911mh.png",
-    "Kim Kardashian": "https://i.imgur.com/KyPr6YO.png",
-    "Dwayne Johnson": "https://i.imgur.com/Y7qsuUR.png",
-    "Taylor Swift": "https://i.imgur.com/UPnlP2R.png",
-    "Beyoncé": "https://i.imgur.com/RpRyUAj.png",
-    "Tom Hanks": "https://i.imgur.com/cTrWk5h.png",
-    "George Washington": "https://i.imgur.com/tUVCsl1.png",
-    "Thomas Jefferson": "https://i.imgur.com/8K25FOc.png",
-    "Theodore Roosevelt": "https://i.imgur.com/TzDCHAC.png",
-    "John F. Kennedy": "https://i.imgur.com/HPIxc99.png",
-    "Joe Biden": "https://i.imgur.com/ugJyCPo.png",
-    "William Shakespeare": "https://i.imgur.com/soq3pQK.png",
-    "Leonardo da Vinci": "https://i.imgur.com/bS0xyua.png",
-    "Napoleon Bonaparte": "https://i.imgur.com/2zBIK9F.png",
-    "Cleopatra": "https://i.imgur.com/H2Q9VtR.png",
-    "Alexander the Great": "https://i.imgur.com/eEBkIK9.png",
-    "Genghis Khan": "https://i.imgur.com/mwl10rQ.png",
-    "Neil Armstrong": "https://i.imgur.com/3Ru5xbR.png",
-    "Buzz Aldrin": "https://i.imgur.com/Y7xLrjJ.png",
-    "Yuri Gagarin": "https://i.imgur.com/eN7rs5y.png",
-    "Sally Ride": "https://i.imgur.com/46gNQ3J.png",
-    "Chris Hadfield": "https://i.imgur.com/yhxuDci.png",
-    "Christopher Columbus": "https://i.imgur.com/39G5x9d.png",
-    "Marco Polo": "https://i.imgur.com/GU7IjkP.png",
-    "Ferdinand Magellan": "https://i.imgur.com/8ByzARF.png",
-    "Zheng He": "https://i.imgur.com/rApUGJG.png",
-    "Roald Amundsen": "https://i.imgur.com/hjHXNGu.png",
-    "Ludwig van Beethoven": "https://i.imgur.com/a5arQAG.png",
-    "Wolfgang Amadeus Mozart": "https://i.imgur.com/0HfV64v.png",
-    "Johann Sebastian Bach": "https://i.imgur.com/neGXtPE.png",
-    "Frédéric Chopin": "https://i.imgur.com/RucCSQf.png",
-    "Pyotr Tchaikovsky": "https://i.imgur.com/dMxDbVJ.png",
-}
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at REAL NOT NULL,
+        person1 TEXT NOT NULL,
+        person2 TEXT NOT NULL,
+        topic TEXT NOT NULL,
+        style TEXT NOT NULL,
+        timings TEXT NOT NULL,
+        messages TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS conversations_person1 ON conversations (person1, created_at);
+    CREATE INDEX IF NOT EXISTS conversations_person2 ON conversations (person2, created_at);
+    CREATE INDEX IF NOT EXISTS conversations_topic ON conversations (topic, created_at);
+    CREATE INDEX IF NOT EXISTS conversations_created_at ON conversations (created_at);
+    """
+
+    SUMMARY_COLUMNS = "id, created_at, person1, person2, topic, style"
+    # distinct() results are kept this long (or until this process appends),
+    # so the sidebar does not scan the table on every rerun
+    DISTINCT_TTL = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._distinct = {}  # column => (time, values)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def append(self, transcript: Transcript) -> int:
+        setup = transcript.setup
+        messages = [[m.source, m.content] for m in transcript.messages]
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO conversations (created_at, person1, person2, topic, style, timings, messages) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    transcript.created_at,
+                    setup.person1,
+                    setup.person2,
+                    setup.topic,
+                    setup.style,
+                    json.dumps(transcript.timings),
+                    json.dumps(messages, ensure_ascii=False),
+                ),
+            )
+            self._distinct.clear()
+        transcript.archive_id = cursor.lastrowid
+        return cursor.lastrowid
+
+    @staticmethod
+    def _filters(person: str = None, topic: str = None, since: float = None, until: float = None):
+        clauses, params = [], []
+        if person:
+            clauses.append("(person1 = ? OR person2 = ?)")
+            params += [person, person]
+        if topic:
+            clauses.append("topic = ?")
+            params.append(topic)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, **filters) -> int:
+        where, params = self._filters(**filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM conversations{where}", params).fetchone()[0]
+
+    def page(self, offset: int = 0, limit: int = HISTORY_PAGE_SIZE, **filters) -> list:
+        """Summaries (no messages) of the newest conversations first."""
+        where, params = self._filters(**filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self.SUMMARY_COLUMNS} FROM conversations{where} "
+                "ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(zip(("id", "created_at", "person1", "person2", "topic", "style"), row)) for row in rows]
+
+    def load(self, conversation_id: int):
+        """The whole Transcript, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, created_at, person1, person2, topic, style, timings, messages "
+                "FROM conversations WHERE id = ?",
+                (conversation_id,),
+            ).fetchone()
+        return self._transcript(row) if row else None
+
+    def find_matchup(self, setup: ContestSetup):
+        """The newest conversation between the same two people on the same topic."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, created_at, person1, person2, topic, style, timings, messages FROM conversations "
+                "WHERE topic = ? AND ((person1 = ? AND person2 = ?) OR (person1 = ? AND person2 = ?)) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (setup.topic, setup.person1, setup.person2, setup.person2, setup.person1),
+            ).fetchone()
+        return self._transcript(row) if row else None
+
+    def distinct(self, column: str) -> list:
+        """All values of 'person' or 'topic', for filters (cached, see DISTINCT_TTL)."""
+        with self._lock:
+            cached = self._distinct.get(column)
+            if cached is not None and time.monotonic() - cached[0] < self.DISTINCT_TTL:
+                return cached[1]
+            if column == "person":
+                rows = self._conn.execute(
+                    "SELECT person1 FROM conversations UNION SELECT person2 FROM conversations ORDER BY 1"
+                ).fetchall()
+            elif column == "topic":
+                rows = self._conn.execute("SELECT DISTINCT topic FROM conversations ORDER BY 1").fetchall()
+            else:
+                raise ValueError(f"Unknown column {column!r}")
+            values = [row[0] for row in rows]
+            self._distinct[column] = (time.monotonic(), values)
+        return values
+
+    @staticmethod
+    def _transcript(row) -> Transcript:
+        conversation_id, created_at, person1, person2, topic, style, timings, messages = row
+        return Transcript(
+            setup=ContestSetup(person1, person2, topic, style),
+            messages=[ChatRecord(source, content) for source, content in json.loads(messages)],
+            created_at=created_at,
+            timings=json.loads(timings),
+            archive_id=conversation_id,
+        )
+
+
+@st.cache_resource
+def get_archive():
+    """The process-wide transcript archive, or None if ARCHIVE_PATH is empty."""
+    if not ARCHIVE_PATH:
+        return None
+    return TranscriptArchive(ARCHIVE_PATH)
 
 
+###############################################################################
+# 4g) Tournaments
+###############################################################################
+def seed_bracket(size: int, rng=random) -> list:
+    """
+    'size' different people in bracket order: entrants 2k and 2k+1 meet
+    in the first round. Each pair is drawn like a single conversation's;
+    the odd one out of an odd 'size' (who gets the bye) is drawn alone.
+    """
+    if not 2 <= size <= len(CATALOG.people):
+        raise ValueError(f"A tournament needs 2 to {len(CATALOG.people)} people, not {size}")
+    people = []
+    while len(people) < size:
+        if size - len(people) >= 2:
+            pair = pick_two_people(rng, exclude=set(people))
+            # pick_pair stops avoiding 'exclude' when the draws keep hitting it
+            if not set(pair) & set(people):
+                people.extend(pair)
+                continue
+        people.append(CATALOG.pick_person(rng, exclude=set(people)))
+    return people
+
+
+def round_setups(people: list, rng=random) -> list:
+    """The matches of one round: neighbours in 'people' meet, each on a fresh topic and style."""
+    return [
+        ContestSetup(people[i], people[i + 1], pick_random_topic(rng), decide_style(rng))
+        for i in range(0, len(people) - 1, 2)
+    ]
+
+
+# The line a tournament match's verdict ends on (see WINNER_LINE_PROMPT)
+WINNER_LINE = re.compile(r"^\W*winner\W*:(.*)$", re.I | re.M)
+WINNER_WORDS = re.compile(r"\b(?:winner|wins?|victor\w*|triumph\w*|last word)\b", re.I)
+
+
+def name_mentions(text: str, person: str, other: str) -> list:
+    """
+    Spans of the whole-word mentions of 'person' in 'text': the full name,
+    or any part of it of three letters or more that 'other' does not share
+    (so "Zheng He" is "Zheng", never "he").
+    """
+    parts = [person] + [p for p in person.split() if len(p) >= 3 and p not in other.split()]
+    pattern = "|".join(rf"\b{re.escape(p)}\b" for p in sorted(set(parts), key=len, reverse=True))
+    return [m.span() for m in re.finditer(pattern, text)]
+
+
+def verdict_winner(setup: ContestSetup, records: list) -> str:
+    """
+    The guest the Host's verdict declares the winner: the one on its
+    "Winner: <name>" line, else the one named nearest a word about winning
+    in the last sentence that has one. Without a verdict, the guest with
+    more turns, as in wrap_up_line.
+    """
+    verdict = next((r.content for r in reversed(records) if r.source == "Host"), "")
+    other = {setup.person1: setup.person2, setup.person2: setup.person1}
+
+    def mentions(text: str, person: str) -> list:
+        return name_mentions(text, person, other[person])
+
+    lines = WINNER_LINE.findall(verdict)
+    named = [p for p in other if lines and mentions(lines[-1], p)]
+    if len(named) == 1:
+        return named[0]
+
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+|\n+", verdict) if WINNER_WORDS.search(s)]
+    for sentence in reversed(sentences):
+        keywords = [m.span() for m in WINNER_WORDS.finditer(sentence)]
+
+        distances = {}
+        for person in other:
+            spans = mentions(sentence, person)
+            if spans:
+                # Characters between the name and the nearest keyword
+                distances[person] = min(
+                    max(start - k_end, k_start - end, 0) for start, end in spans for k_start, k_end in keywords
+                )
+        if distances:
+            return min(distances, key=distances.get)
+    turns1 = sum(r.source == "Arguer1" for r in records)
+    turns2 = sum(r.source == "Arguer2" for r in records)
+    return setup.person1 if turns1 >= turns2 else setup.person2
+
+
+async def run_matches(model_client: "ChatCompletionClient", setups: list, concurrency: int, **contest_kwargs):
+    """
+    Runs the conversations of 'setups' at most 'concurrency' at a time on
+    one event loop, sharing 'model_client', and yields (match index, step)
+    in the order the steps are produced. 'contest_kwargs' go to
+    run_famous_people_contest; the Host names each winner on a line of its
+    own. Stopping the iteration cancels the matches.
+    """
+    step_queue = asyncio.Queue()
+    seats = asyncio.Semaphore(max(1, concurrency))
+
+    async def play(index: int, setup: ContestSetup):
+        try:
+            async with seats:
+                async for step in agents().run_famous_people_contest(
+                    model_client, setup=setup, winner_line=True, **contest_kwargs
+                ):
+                    await step_queue.put((index, step))
+        except Exception as e:
+            await step_queue.put((index, e))
+        finally:
+            await step_queue.put((index, _STREAM_DONE))
+
+    tasks = [asyncio.ensure_future(play(i, setup)) for i, setup in enumerate(setups)]
+    try:
+        playing = len(tasks)
+        while playing:
+            index, item = await step_queue.get()
+            if item is _STREAM_DONE:
+                playing -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield index, item
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Each match stops its agents as it unwinds; wait for that
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+###############################################################################
+# 5) AVATARS (No names displayed, only pictures)
+###############################################################################
+# 1) Person avatars come from the catalog (PERSON_AVATARS)
 
 # 2) Generic role-based avatars
 AVATAR_URLS = {
@@ -444,85 +1593,596 @@ AVATAR_URLS = {
     "fallback": "https://i.imgur.com/wyw9Hrf.png",
 }
 
+TITLE_IMAGE_URL = "https://i.imgur.com/gqyfdYm.png"
+
+# 3) Local thumbnails, built by build_avatars.py into static/avatars/.
+#    Streamlit serves static/ under app/static/ (see .streamlit/config.toml).
+AVATAR_STATIC_DIR = os.path.join("static", "avatars")
+AVATAR_STATIC_URL = "app/static/"
+
+
+AVATAR_BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), AVATAR_STATIC_DIR)
+# How often to look for the build output again while it is missing
+AVATAR_RETRY_SECONDS = 30
+
+# mode => thumbnails, and when the build output was last found missing
+_avatar_thumbnails = {}
+_avatar_misses = {}
+
+
+def read_avatar_thumbnails(mode: str) -> dict:
+    """
+    Original URL => (src, srcset) of its local thumbnail, from the build
+    output. Empty when the thumbnails were not built.
+    """
+    try:
+        if mode == "static":
+            with open(os.path.join(AVATAR_BUILD_DIR, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            return {
+                url: (AVATAR_STATIC_URL + entry["1x"], f'{AVATAR_STATIC_URL}{entry["2x"]} 2x')
+                for url, entry in manifest.items()
+            }
+        if mode == "inline":
+            with open(os.path.join(AVATAR_BUILD_DIR, "bundle.json"), encoding="utf-8") as f:
+                return {url: (uri, None) for url, uri in json.load(f).items()}
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
+def load_avatar_thumbnails(mode: str = AVATAR_MODE) -> dict:
+    """
+    read_avatar_thumbnails, kept for the process once found. While the
+    build output is missing (the remote URLs are used meanwhile), it is
+    looked for again every AVATAR_RETRY_SECONDS, so a build finishing
+    later (see start_avatar_build) is picked up.
+    """
+    thumbnails = _avatar_thumbnails.get(mode)
+    if thumbnails:
+        return thumbnails
+    if time.monotonic() - _avatar_misses.get(mode, -AVATAR_RETRY_SECONDS) < AVATAR_RETRY_SECONDS:
+        return {}
+    thumbnails = read_avatar_thumbnails(mode)
+    if thumbnails:
+        _avatar_thumbnails[mode] = thumbnails
+    else:
+        _avatar_misses[mode] = time.monotonic()
+    return thumbnails
+
+
+@st.cache_resource(show_spinner=False)
+def start_avatar_build():
+    """
+    Runs build_avatars.build() once per process, in the background, when
+    the thumbnails are not there yet (e.g. on a fresh deploy). Returns the
+    thread, or None if there is nothing to build.
+    """
+    if AVATAR_MODE == "remote" or os.path.exists(os.path.join(AVATAR_BUILD_DIR, "manifest.json")):
+        return None
+
+    def build():
+        try:
+            import build_avatars
+
+            manifest, missing = build_avatars.build()
+            print(f"Avatar thumbnails built: {len(manifest)}, {len(missing)} missing", file=sys.stderr)
+        except Exception as e:
+            print(f"Avatar thumbnails not built ({type(e).__name__}: {e}); using the remote URLs", file=sys.stderr)
+
+    thread = threading.Thread(target=build, name="time-machine-avatars", daemon=True)
+    thread.start()
+    return thread
+
+
+def avatar_thumbnail(url: str) -> tuple:
+    """(src, srcset) to show for an avatar URL; srcset may be None."""
+    return load_avatar_thumbnails(AVATAR_MODE).get(url, (url, None))
+
+
 # Two bubble background colors (pastel blue & pastel pink)
 BUBBLE_COLORS = ["#f0f5ff", "#ffe9f0"]
 
+# The bubble styling, sent to the browser once per page instead of with
+# every message. Bubbles only carry their class names.
+BUBBLE_CSS = f"""
+.tm-bubble {{
+    color:#000;
+    padding:10px;
+    border-radius:6px;
+    margin-bottom:10px;
+    display:flex;
+    align-items:center;
+    box-shadow: 0 1px 3px rgba(0,0,0,0.2);
+}}
+.tm-bubble-0 {{ background-color:{BUBBLE_COLORS[0]}; }}
+.tm-bubble-1 {{ background-color:{BUBBLE_COLORS[1]}; }}
+.tm-avatar {{
+    width:50px;
+    height:50px;
+    border-radius:20px;
+    margin-right:10px;
+    flex-shrink:0;
+}}
+"""
+
+
+def bubble_html(avatar_url: str, content: str, index: int) -> str:
+    """
+    One message bubble as a single line of HTML (styled by BUBBLE_CSS).
+    The 'index' is used to alternate bubble colors.
+    """
+    src, srcset = avatar_thumbnail(avatar_url)
+    srcset_attr = f' srcset="{srcset}"' if srcset else ""
+    return (
+        f'<div class="tm-bubble tm-bubble-{index % 2}">'
+        f'<img class="tm-avatar" src="{src}"{srcset_attr} />'
+        f"<div>{content}</div></div>"
+    )
+
 
-def display_avatar_and_text(avatar_url: str, content: str, index: int):
+def display_avatar_and_text(avatar_url: str, content: str, index: int, slot=None):
     """
     Render a message bubble with an avatar.
     The 'index' is used to alternate bubble colors.
+    If a 'slot' (e.g. st.empty()) is given, the bubble is drawn into it.
     """
-    bg_color = BUBBLE_COLORS[index % 2]
+    target = slot if slot is not None else st
+    target.markdown(bubble_html(avatar_url, content, index), unsafe_allow_html=True)
 
-    st.markdown(
-        f"""
-        <div style="
-            background-color:{bg_color};
-            color:#000;
-            padding:10px;
-            border-radius:6px;
-            margin-bottom:10px;
-            display:flex;
-            align-items:center;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.2);
-        ">
-            <img src="{avatar_url}" style="
-                width:50px;
-                height:50px;
-                border-radius:20px;
-                margin-right:10px;
-            "  />
-            <div>{content}</div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+
+# This dictionary ensures mapping between returned .source and roles
+NAME_MAP = {
+    "assistant": "Host",
+    "assistant_1": "Arguer1",
+    "assistant_2": "Arguer2",
+    "system": "God",
+    "": "fallback",
+}
+
+
+def parse_god_line(line: str):
+    """
+    Figure out which real people were chosen (person1, person2)
+    by parsing the "God" line. Returns None if the line does not match.
+    """
+    match = re.search(r"let (.*?) and (.*?) converse about", line)
+    if match:
+        return match.group(1).strip(), match.group(2).strip()
+    return None
+
+
+def resolve_avatar(mapped_name: str, person1_real: str, person2_real: str) -> str:
+    """
+    If Arguer1 => look up person1_real in PERSON_AVATARS
+    If not found, fallback to "Arguer1" from AVATAR_URLS
+    """
+    if mapped_name == "Arguer1":
+        return PERSON_AVATARS.get(person1_real, AVATAR_URLS["Arguer1"])
+    elif mapped_name == "Arguer2":
+        return PERSON_AVATARS.get(person2_real, AVATAR_URLS["Arguer2"])
+    # e.g. God, Host, user, fallback
+    return AVATAR_URLS.get(mapped_name, AVATAR_URLS["fallback"])
+
+
+class ConversationRenderer:
+    """
+    Draws conversation steps as they arrive. Each finished message is one
+    small delta appended after the previous ones, so earlier bubbles are
+    never sent again; only the bubble that is still streaming is patched
+    in place. render_batch() draws a whole transcript as one fragment.
+    With a 'tracer', every bubble drawn is recorded as a "render" span.
+    """
+
+    def __init__(self, tracer: Tracer = None):
+        self.person1_real = "Unknown Person1"
+        self.person2_real = "Unknown Person2"
+        self.index = 0
+        self.tracer = tracer
+        # The bubble that is still being streamed: source, text, slot, index
+        self._streaming = None
+        self._last_draw = 0.0
+
+    def _draw(self, source_val: str, content: str, index: int, slot, partial: bool = False):
+        avatar_url = self._avatar_for(source_val)
+        if self.tracer is None:
+            display_avatar_and_text(avatar_url, content, index, slot)
+            return
+        with self.tracer.span("render_partial" if partial else "render", source_val, chars=len(content)):
+            display_avatar_and_text(avatar_url, content, index, slot)
+
+    def _avatar_for(self, source_val: str) -> str:
+        # Map .source to a known role if needed
+        mapped_name = NAME_MAP.get(source_val, source_val)
+        return resolve_avatar(mapped_name, self.person1_real, self.person2_real)
+
+    def render_chunk(self, chunk: TokenChunk):
+        """Grows the bubble of the agent that is currently speaking."""
+        live = self._streaming
+        if live is None or live["source"] != chunk.source:
+            live = {"source": chunk.source, "text": "", "slot": st.empty(), "index": self.index}
+            self._streaming = live
+            self.index += 1
+        live["text"] += chunk.content
+
+        now = time.monotonic()
+        if now - self._last_draw < STREAM_REFRESH_SECONDS:
+            return
+        self._last_draw = now
+        if live["text"].strip():
+            self._draw(chunk.source, live["text"] + " ▌", live["index"], live["slot"], partial=True)
+
+    def _accept(self, step):
+        """
+        Books a finished step: returns (index, slot, source, content) for a
+        bubble to draw, or None for empty steps. 'slot' is the streamed
+        bubble this message replaces, if any.
+        """
+        # The final message replaces the bubble that was streamed for it
+        live = self._streaming
+        self._streaming = None
+        if live is not None and live["source"] == getattr(step, "source", None):
+            i, slot = live["index"], live["slot"]
+        else:
+            i, slot = self.index, None
+            self.index += 1
+
+        content = getattr(step, "content", "")
+        source_val = getattr(step, "source", "")
+
+        if not isinstance(content, str) or not content.strip():
+            if slot is not None:
+                slot.empty()
+            return None  # skip empty
+
+        if source_val == "God":
+            people = parse_god_line(content)
+            if people:
+                self.person1_real, self.person2_real = people
+        return i, slot, source_val, content
+
+    def render(self, step):
+        if isinstance(step, TokenChunk):
+            self.render_chunk(step)
+            return
+        accepted = self._accept(step)
+        if accepted is not None:
+            i, slot, source_val, content = accepted
+            self._draw(source_val, content, i, slot)
+
+    def transcript_html(self, steps) -> str:
+        """The bubbles of all (finished) 'steps' as one HTML fragment."""
+        bubbles = []
+        for step in steps:
+            accepted = self._accept(step)
+            if accepted is not None:
+                i, _, source_val, content = accepted
+                bubbles.append(bubble_html(self._avatar_for(source_val), content, i))
+        return "\n".join(bubbles)
+
+    def render_batch(self, steps) -> str:
+        """Draws a finished conversation with a single Streamlit delta; returns its HTML."""
+        html = self.transcript_html(steps)
+        if self.tracer is None:
+            st.markdown(html, unsafe_allow_html=True)
+            return html
+        with self.tracer.span("render", "transcript", chars=len(html)):
+            st.markdown(html, unsafe_allow_html=True)
+        return html
 
 
 ###############################################################################
 # 6) The Streamlit UI
 ###############################################################################
 
-async def get_contest_messages():
+PROGRESS_TEXT = "_Agents are talking ({count} messages so far). The conversation begins with the initiator agent invoking God, who selects the topic and participants. A Host then clarifies the topic, introduces the two participants, and prompts them to present their arguments. Finally, the Host evaluates the discussion and may optionally declare a winner of the short debate._"
+QUEUE_TEXT = "_Many people are time travelling right now. You are number {position} in line; your conversation starts as soon as a seat is free._"
+
+
+def session_id() -> str:
+    """A stable id for this browser session."""
+    return st.session_state.setdefault("session_id", uuid.uuid4().hex)
+
+
+def run_contest_for_session(
+    service: ConversationService,
+    model_client: "ChatCompletionClient",
+    tracer: Tracer = None,
+    setup: ContestSetup = None,
+    live: bool = True,
+):
+    """
+    Runs the multi-agent conversation from run_famous_people_contest
+    through the conversation service, showing the place in line and then
+    the progress. 'live' draws every message step as soon as the agents
+    yield it (with STREAM_TOKENS, each bubble also grows token by token);
+    otherwise the conversation is drawn once it is complete.
+    Returns the message steps (without the token chunks) and the timings.
+    """
+    status = st.empty()
+    renderer = ConversationRenderer(tracer)
+    steps = []
+    timings = {}
+
+    def show_position(position: int):
+        if position > 0:
+            status.info(QUEUE_TEXT.format(position=position))
+        else:
+            status.caption(PROGRESS_TEXT.format(count=0))
+
+    def contest():
+        return agents().run_famous_people_contest(
+            model_client, setup=setup, stream_tokens=live and STREAM_TOKENS, tracer=tracer
+        )
+
+    started = time.monotonic()
+    for m in service.stream(session_id(), contest, show_position):
+        if "first_message_seconds" not in timings and getattr(m, "source", "user") != "user":
+            timings["first_message_seconds"] = time.monotonic() - started
+        if live:
+            renderer.render(m)
+        if not isinstance(m, TokenChunk):
+            steps.append(m)
+            status.caption(PROGRESS_TEXT.format(count=len(steps)))
+    timings["wall_seconds"] = time.monotonic() - started
+    status.empty()
+
+    if not live:
+        renderer.render_batch(steps)
+    return steps, timings
+
+
+TOURNAMENT_TEXT = "_{count} matches on, side by side. The Host's verdicts send the winners to the next round._"
+
+
+def match_caption(setup: ContestSetup) -> str:
+    return f"**{setup.person1}** vs **{setup.person2}**: {setup.topic}"
+
+
+def run_tournament_for_session(
+    service: ConversationService,
+    model_client: "ChatCompletionClient",
+    tracer: Tracer = None,
+    size: int = TOURNAMENT_SIZE,
+):
+    """
+    Plays a knockout tournament of 'size' people from seed_bracket. The
+    matches of a round run concurrently (see run_matches) and take as
+    many seats of the service, and each streams into its own column;
+    the winners of the Host's verdicts meet in the next round.
+    Returns the matches' Transcripts, in order, and the HTML of the
+    whole bracket for the session.
+    """
+    people = seed_bracket(size)
+    transcripts = []
+    html = []
+    round_number = 1
+    while len(people) > 1:
+        setups = round_setups(people)
+        bye = people[-1:] if len(people) % 2 else []
+        title = "Final" if len(setups) == 1 else f"Round {round_number}"
+        st.subheader(title)
+        status = st.empty()
+        columns = st.columns(len(setups))
+        renderers = [ConversationRenderer(tracer) for _ in setups]
+        steps = [[] for _ in setups]
+        for column, setup in zip(columns, setups):
+            column.markdown(match_caption(setup))
+
+        def show_position(position: int):
+            if position > 0:
+                status.info(QUEUE_TEXT.format(position=position))
+            else:
+                status.caption(TOURNAMENT_TEXT.format(count=len(setups)))
+
+        # The round holds one seat of the service per match it runs at once
+        seats = min(len(setups), TOURNAMENT_CONCURRENCY, service.max_concurrency)
+
+        def matches():
+            return run_matches(
+                model_client, setups, seats, stream_tokens=LIVE_RENDERING and STREAM_TOKENS, tracer=tracer
+            )
+
+        started = time.monotonic()
+        for index, m in service.stream(session_id(), matches, show_position, seats):
+            if LIVE_RENDERING:
+                with columns[index]:
+                    renderers[index].render(m)
+            if not isinstance(m, TokenChunk):
+                steps[index].append(m)
+        timings = {"wall_seconds": time.monotonic() - started}
+        status.empty()
+
+        bracket = []
+        people = []
+        for column, renderer, setup, match_steps in zip(columns, renderers, setups, steps):
+            transcript = Transcript(setup, step_records(match_steps), time.time(), dict(timings))
+            winner = verdict_winner(setup, transcript.messages)
+            transcripts.append(transcript)
+            people.append(winner)
+            with column:
+                match_html = ConversationRenderer().transcript_html(transcript.messages)
+                if not LIVE_RENDERING:
+                    st.markdown(match_html, unsafe_allow_html=True)
+                st.caption(f"{winner} advances")
+            bracket.append(
+                f'<div style="flex:1; min-width:0;"><p>{setup.person1} vs {setup.person2}: {setup.topic}</p>'
+                f"{match_html}<p><em>{winner} advances</em></p></div>"
+            )
+        html.append(f'<h3>{title}</h3><div style="display:flex; gap:1rem;">{"".join(bracket)}</div>')
+        if bye:
+            st.caption(f"{bye[0]} advances without a match")
+        people += bye
+        round_number += 1
+
+    champion = f"{people[0]} wins the tournament!"
+    st.success(champion)
+    html.append(f"<p><strong>{champion}</strong></p>")
+    return transcripts, "\n".join(html)
+
+
+def export_trace(tracer: Tracer, metrics: TraceMetrics):
+    """Appends the spans to TRACE_DIR/trace.jsonl and rewrites metrics.prom."""
+    if not TRACE_DIR:
+        return
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    tracer.write_jsonl(os.path.join(TRACE_DIR, "trace.jsonl"))
+    prom_path = os.path.join(TRACE_DIR, "metrics.prom")
+    with open(prom_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(metrics.prometheus_text())
+    os.replace(prom_path + ".tmp", prom_path)
+
+
+def draw_session_setup() -> ContestSetup:
+    """
+    A random setup that avoids the people this session has seen recently.
+    Drawn per session, so no state is shared between users.
+    """
+    recent = st.session_state.setdefault("recent_people", [])
+    setup = draw_contest_setup(exclude=set(recent))
+    recent.extend([setup.person1, setup.person2])
+    if len(recent) > SESSION_NO_REPEAT:
+        del recent[:len(recent) - SESSION_NO_REPEAT]
+    return setup
+
+
+@dataclass
+class ShownConversation:
+    """A finished conversation kept in the session, ready to redraw."""
+    transcript: Transcript
+    # The transcript's bubbles, rendered once by ConversationRenderer
+    html: str
+
+
+def keep_in_session(transcript: Transcript, html: str = None) -> ShownConversation:
     """
-    Runs the multi-agent conversation from run_famous_people_contest,
-    returning all message steps.
+    Keeps 'transcript' and its bubbles' 'html' (rendered here if not
+    given) as the session's conversation, in place of the previous one:
+    only the latest is ever redrawn, older ones are in the archive.
     """
-    with st.spinner("_Agents are talking. The conversation begins with the initiator agent invoking God, who selects the topic and participants. A Host then clarifies the topic, introduces the two participants, and prompts them to present their arguments. Finally, the Host evaluates the discussion and may optionally declare a winner of the short debate. Rerun if the loading time is too long._"):
-        msgs = []
-        async for m in run_famous_people_contest():
-            msgs.append(m)
-        return msgs
+    if html is None:
+        html = ConversationRenderer().transcript_html(transcript.messages)
+    shown = ShownConversation(transcript, html)
+    st.session_state["shown_conversation"] = shown
+    return shown
+
+
+def last_shown_conversation() -> ShownConversation:
+    """The session's latest finished conversation, or None."""
+    return st.session_state.get("shown_conversation")
+
+
+def set_history_page(page: int):
+    st.session_state["history_page"] = max(0, page)
+
+
+def open_history_entry(conversation_id):
+    st.session_state["history_open"] = conversation_id
+
+
+def show_history_sidebar(archive: TranscriptArchive):
+    """
+    Pages through the archive in the sidebar. Only the summaries of the
+    visible page are queried; a transcript is loaded when it is opened.
+    """
+    with st.sidebar:
+        st.write("### History")
+        person = st.selectbox("Person", [""] + archive.distinct("person"), key="history_person")
+        topic = st.selectbox("Topic", [""] + archive.distinct("topic"), key="history_topic")
+        filters = {"person": person or None, "topic": topic or None}
+
+        total = archive.count(**filters)
+        pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+        page = min(st.session_state.get("history_page", 0), pages - 1)
+        for row in archive.page(page * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE, **filters):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["created_at"]))
+            st.button(
+                f"{row['person1']} vs {row['person2']}: {row['topic']} ({when})",
+                key=f"history-{row['id']}",
+                on_click=open_history_entry,
+                args=(row["id"],),
+            )
+
+        previous_col, label_col, next_col = st.columns([1, 2, 1])
+        previous_col.button("‹", key="history_previous", disabled=page == 0,
+                            on_click=set_history_page, args=(page - 1,))
+        label_col.caption(f"Page {page + 1} of {pages} ({total} conversations)")
+        next_col.button("›", key="history_next", disabled=page >= pages - 1,
+                        on_click=set_history_page, args=(page + 1,))
+
+
+def show_debug_panel(tracer: Tracer, metrics: TraceMetrics, steps: list, pool=None, governor=None):
+    """Spans, counters and raw messages of the conversation just shown."""
+    with st.expander("Debug: Trace"):
+        st.write("### Time per span")
+        st.dataframe(tracer.summary())
+        st.write("### Spans")
+        st.dataframe([asdict(span) for span in tracer.spans])
+        if pool is not None:
+            st.write("### Pool")
+            st.json(pool.metrics())
+        if governor is not None:
+            st.write("### Request governor")
+            st.json(governor.metrics())
+        st.download_button(
+            "Download trace (JSONL)",
+            tracer.to_jsonl(),
+            file_name=f"trace-{tracer.conversation_id}.jsonl",
+        )
+        st.download_button(
+            "Download metrics (Prometheus)",
+            metrics.prometheus_text(),
+            file_name="metrics.prom",
+        )
+        st.write("### Raw Messages")
+        for step in steps:
+            st.write(step)  # Print the full raw data for each step
+
+
+# Subtle gradient background + minimal styling; built once per process
+PAGE_STYLE = """
+<style>
+body {
+    background: linear-gradient(120deg, #ffffff 0%, #f7f7f7 100%);
+    color: #333;
+    font-family: "Helvetica Neue", Arial, sans-serif;
+    margin: 0;
+    padding: 0;
+}
+.css-1oe6wy4.e1tzin5v2 {
+    justify-content: center;
+}
+""" + BUBBLE_CSS + """
+</style>
+"""
+
+
+def run_failure(error: Exception):
+    """
+    What to tell the user about a run that failed with 'error': the
+    ModelUnavailableError behind it, else the ConversationFailedError, or
+    None for other errors (bugs, which are raised).
+    """
+    # The agents swallow the governor's error; its state tells
+    governor = get_governor()
+    if not isinstance(error, ModelUnavailableError) and governor is not None:
+        error = governor.open_error() or error
+    if isinstance(error, (ModelUnavailableError, ConversationFailedError)):
+        return error
+    return None
 
 
 def main():
     st.set_page_config(page_title="Time Machine", layout="centered")
+    start_avatar_build()
 
-    # Subtle gradient background + minimal styling
-    st.markdown(
-        """
-        <style>
-        body {
-            background: linear-gradient(120deg, #ffffff 0%, #f7f7f7 100%);
-            color: #333;
-            font-family: "Helvetica Neue", Arial, sans-serif;
-            margin: 0;
-            padding: 0;
-        }
-        .css-1oe6wy4.e1tzin5v2 {
-            justify-content: center;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(PAGE_STYLE, unsafe_allow_html=True)
 
     # Title area with clock image
     st.markdown(
-        """
+        f"""
         <div style="display:flex; align-items:center; margin-bottom:1rem;">
-            <img src="https://i.imgur.com/gqyfdYm.png"
+            <img src="{avatar_thumbnail(TITLE_IMAGE_URL)[0]}"
                  style="width:50px; margin-right:15px;" />
             <h1 style="margin:0; font-size:2.2rem;">Time Machine</h1>
         </div>
@@ -533,69 +2193,93 @@ def main():
     st.write("Press **Run** to initiate the conversation")
     st.write("_It may take a few moments to generate the entire dialogue_")
 
-    if st.button("Run"):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        conversation_steps = loop.run_until_complete(get_contest_messages())
-        loop.close()
-
-        # Debug: Print all raw messages for inspection
-        # st.write("### Debug: Raw Messages")
-        # for step in conversation_steps:
-            # st.write(step)  # Print the full raw data for each step
-
-        # This dictionary ensures mapping between returned .source and roles
-        name_map = {
-            "assistant": "Host",
-            "assistant_1": "Arguer1",
-            "assistant_2": "Arguer2",
-            "system": "God",
-            "": "fallback",
-        }
-
-        # 1) Figure out which real people were chosen (person1, person2)
-        #    by parsing the "God" line
-        import re
-        person1_real = "Unknown Person1"
-        person2_real = "Unknown Person2"
-        for msg in conversation_steps:
-            if getattr(msg, "source", "") == "God":
-                line = getattr(msg, "content", "")
-                match = re.search(r"let (.*?) and (.*?) converse about", line)
-                if match:
-                    person1_real = match.group(1).strip()
-                    person2_real = match.group(2).strip()
-                break
-
-        # 2) Now process each step, applying the name_map for .source
-        #    and using PERSON_AVATARS for Arguer1/Arguer2.
-        for i, step in enumerate(conversation_steps):
-            content = getattr(step, "content", "")
-            source_val = getattr(step, "source", "")
-
-            # Debug: Print the source and content
-            # st.write(f"DEBUG: Agent: {source_val}, Content: {content}")
-
-            if not content.strip():
-                continue  # skip empty
-
-            # Map .source to a known role if needed
-            mapped_name = name_map.get(source_val, source_val)
-
-            # 3) If Arguer1 => look up person1_real in PERSON_AVATARS
-            #    If not found, fallback to "Arguer1" from AVATAR_URLS
-            if mapped_name == "Arguer1":
-                avatar_url = PERSON_AVATARS.get(person1_real, AVATAR_URLS["Arguer1"])
-            elif mapped_name == "Arguer2":
-                avatar_url = PERSON_AVATARS.get(person2_real, AVATAR_URLS["Arguer2"])
-            else:
-                # e.g. God, Host, user, fallback
-                avatar_url = AVATAR_URLS.get(mapped_name, AVATAR_URLS["fallback"])
-
-            display_avatar_and_text(avatar_url, content, i)
+    archive = get_archive()
+    if archive is not None:
+        show_history_sidebar(archive)
+
+    run_pressed = st.button("Run")
+    tournament_pressed = TOURNAMENT_SIZE >= 2 and st.button(f"Run a tournament of {TOURNAMENT_SIZE}")
+
+    if run_pressed:
+        # Shared by all sessions; created once per process
+        service = get_service()
+        model_client = get_model_client()
+        pool = get_pool()
+        ready = pool.pop() if pool is not None else None
+        metrics = get_trace_metrics()
+        tracer = Tracer(metrics)
+        st.session_state.pop("history_open", None)
+
+        setup = None
+        html = None
+        if ready is None:
+            setup = draw_session_setup()
+            if archive is not None and ARCHIVE_SERVE:
+                # A matchup shown before costs nothing the second time
+                ready = archive.find_matchup(setup)
+
+        if ready is not None:
+            # A conversation generated ahead of time: no waiting at all
+            transcript = ready
+            conversation_steps = ready.messages
+            html = ConversationRenderer(tracer).render_batch(conversation_steps)
+        else:
+            # With LIVE_RENDERING, each message is drawn as soon as run_stream yields it
+            try:
+                conversation_steps, timings = run_contest_for_session(
+                    service, model_client, tracer, setup, live=LIVE_RENDERING
+                )
+            except Exception as e:
+                failure = run_failure(e)
+                if failure is None:
+                    raise
+                # Nothing is archived or kept: the next rerun shows no broken show
+                st.error(str(failure))
+                return
+            transcript = Transcript(setup, step_records(conversation_steps), time.time(), timings)
+
+        if archive is not None and transcript.archive_id is None:
+            archive.append(transcript)
+        keep_in_session(transcript, html)
+
+        export_trace(tracer, metrics)
+        if DEBUG_PANEL:
+            show_debug_panel(tracer, metrics, conversation_steps, pool, get_governor())
+    elif tournament_pressed:
+        service = get_service()
+        model_client = get_model_client()
+        metrics = get_trace_metrics()
+        tracer = Tracer(metrics)
+        st.session_state.pop("history_open", None)
+        try:
+            transcripts, html = run_tournament_for_session(service, model_client, tracer)
+        except Exception as e:
+            failure = run_failure(e)
+            if failure is None:
+                raise
+            st.error(str(failure))
+            return
+
+        if archive is not None:
+            for transcript in transcripts:
+                archive.append(transcript)
+        # A rerun redraws the whole bracket
+        keep_in_session(transcripts[-1], html)
+
+        export_trace(tracer, metrics)
+        if DEBUG_PANEL:
+            steps = [m for transcript in transcripts for m in transcript.messages]
+            show_debug_panel(tracer, metrics, steps, None, get_governor())
+    elif archive is not None and st.session_state.get("history_open") is not None:
+        # A conversation picked in the history sidebar
+        past = archive.load(st.session_state["history_open"])
+        if past is not None:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(past.created_at))
+            st.caption(f"From the archive, {when}")
+            ConversationRenderer().render_batch(past.messages)
+    elif last_shown_conversation() is not None:
+        # Any other rerun (a widget, a resize, a reconnect) redraws the
+        # finished conversation from the session, without the agents
+        st.markdown(last_shown_conversation().html, unsafe_allow_html=True)
 
     st.write("---")
-
-
-if __name__ == "__main__":
-    main()
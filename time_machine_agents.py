@@ -0,0 +1,1276 @@
+##########################################################
+# time_machine_agents.py
+##########################################################
+"""
+The agent side of the Time Machine: the autogen agents and team, the
+OpenAI model client and the wrappers around it.
+
+It is split from time_machine.py so that the app's cold start and its
+reruns never load the agent framework: time_machine imports this module
+on the first "Run" (see time_machine.agents()), and scripts keep using
+the names through time_machine as before.
+"""
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from types import MappingProxyType
+
+import openai
+import streamlit as st
+
+from autogen_core.models import AssistantMessage, ChatCompletionClient, CreateResult, SystemMessage, UserMessage
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+from autogen_agentchat.agents import AssistantAgent, BaseChatAgent
+from autogen_core import CancellationToken
+from autogen_agentchat.base import Response, TerminatedException, TerminationCondition
+from autogen_agentchat.messages import StopMessage, TextMessage
+from autogen_agentchat.teams import SelectorGroupChat
+from autogen_agentchat.conditions import TextMentionTermination
+
+from time_machine import (
+    ARGUERS,
+    CLOSING_LINE,
+    ContestSetup,
+    CONTEXT_WINDOW,
+    CONVERSATION_DEADLINE,
+    ConversationFailedError,
+    draw_contest_setup,
+    god_line,
+    is_complete,
+    MAX_CONVERSATION_TOKENS,
+    MAX_MESSAGES,
+    MODEL_CACHE_DIR,
+    MODEL_CACHE_MAX_MB,
+    MODEL_CACHE_MODE,
+    MODEL_NAME,
+    MODEL_TEMPERATURE,
+    persona_facts,
+    PIPELINED_TURNS,
+    PROFILES_SETTING,
+    RequestGovernor,
+    SCRIPTED_TURNS,
+    ShowScheduler,
+    SMALL_MODEL_NAME,
+    Span,
+    step_records,
+    _STREAM_DONE,
+    TokenChunk,
+    Tracer,
+    Transcript,
+    TURN_SCHEDULER,
+    _usage_tokens,
+    wrap_up_line,
+)
+
+###############################################################################
+# 3b) Scripted turns
+###############################################################################
+class ScriptedAgent(BaseChatAgent):
+    """
+    An agent that always says the same prepared line.
+    Stands in for an AssistantAgent whose output is fixed, so the turn
+    costs no model call.
+    """
+
+    def __init__(self, name: str, description: str, line: str):
+        super().__init__(name=name, description=description)
+        self._line = line
+
+    @property
+    def produced_message_types(self):
+        return [TextMessage]
+
+    async def on_messages(self, messages, cancellation_token):
+        return Response(chat_message=TextMessage(content=self._line, source=self.name))
+
+    async def on_reset(self, cancellation_token):
+        pass
+
+
+class BudgetTermination(TerminationCondition):
+    """
+    Stops the chat once it has used up its budget: 'max_messages'
+    messages, 'max_tokens' tokens (as reported with the messages) or
+    'deadline_seconds' since it was created. 0 disables a limit.
+    'exceeded' names the budget that ran out; unlike the rest of the
+    state, it is kept across reset(), which the team calls when it stops.
+    """
+
+    def __init__(self, max_messages: int = 0, max_tokens: int = 0, deadline_seconds: float = 0):
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.deadline_seconds = deadline_seconds
+        self._started = time.monotonic()
+        self._terminated = False
+        self.messages = 0
+        self.tokens = 0
+        self.exceeded = None
+
+    @property
+    def terminated(self) -> bool:
+        return self._terminated
+
+    def remaining_seconds(self):
+        """Seconds left before the deadline, or None without one."""
+        if not self.deadline_seconds:
+            return None
+        return max(0.0, self.deadline_seconds - (time.monotonic() - self._started))
+
+    async def __call__(self, messages):
+        if self._terminated:
+            raise TerminatedException("Termination condition has already been reached")
+        for message in messages:
+            self.messages += 1
+            self.tokens += sum(_usage_tokens(getattr(message, "models_usage", None)))
+        if self.max_messages and self.messages >= self.max_messages:
+            self.exceeded = "messages"
+        elif self.max_tokens and self.tokens >= self.max_tokens:
+            self.exceeded = "tokens"
+        elif self.remaining_seconds() == 0:
+            self.exceeded = "deadline"
+        if self.exceeded is None:
+            return None
+        self._terminated = True
+        return StopMessage(content=f"Conversation budget exceeded: {self.exceeded}", source="BudgetTermination")
+
+    async def reset(self):
+        self._terminated = False
+        self.messages = 0
+        self.tokens = 0
+
+
+async def _until_deadline(stream, budget: BudgetTermination, cancellation_token: CancellationToken):
+    """
+    Passes the items of 'stream' on until the budget's deadline. The
+    termination condition only runs between messages; this also stops a
+    model call that is still running when time is up.
+    """
+    iterator = stream.__aiter__()
+    try:
+        while True:
+            try:
+                # Not wait_for: on Python 3.11 it can swallow a cancellation
+                # that arrives as the item does, and the show plays on
+                async with asyncio.timeout(budget.remaining_seconds()):
+                    item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            except TimeoutError:
+                budget.exceeded = "deadline"
+                cancellation_token.cancel()
+                return
+            yield item
+    finally:
+        await iterator.aclose()
+
+
+###############################################################################
+# 4) Model client wrappers
+###############################################################################
+class ModelClientWrapper(ChatCompletionClient):
+    """
+    Base for model clients that wrap another one.
+    Everything is forwarded to the inner client; subclasses override
+    create() / create_stream() to add behaviour around the model call.
+    """
+
+    def __init__(self, inner: ChatCompletionClient):
+        self._inner = inner
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        return await self._inner.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    def create_stream(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        return self._inner.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    def actual_usage(self):
+        return self._inner.actual_usage()
+
+    def total_usage(self):
+        return self._inner.total_usage()
+
+    def count_tokens(self, messages, tools=[]):
+        return self._inner.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages, tools=[]):
+        return self._inner.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self):
+        return self._inner.capabilities
+
+    @property
+    def model_info(self):
+        return self._inner.model_info
+
+
+class StreamingModelClient(ModelClientWrapper):
+    """
+    Serves every create() call with create_stream() on the inner client.
+    Text chunks are passed to the async 'on_chunk' callback as they arrive,
+    tagged with the agent name; the agent still gets the final CreateResult.
+    The stream is asked to end with the usage, which a streamed response
+    otherwise leaves out (and the token budget and governor then see 0).
+    """
+
+    def __init__(self, inner: ChatCompletionClient, source: str, on_chunk):
+        super().__init__(inner)
+        self._source = source
+        self._on_chunk = on_chunk
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        result = None
+        async for item in self._inner.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args={**extra_create_args, "stream_options": {"include_usage": True}},
+            cancellation_token=cancellation_token,
+        ):
+            if isinstance(item, str):
+                await self._on_chunk(TokenChunk(source=self._source, content=item))
+            else:
+                result = item
+        return result
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a response was never recorded."""
+
+
+class ResponseStore:
+    """
+    Model responses on disk, one JSON file per key.
+    When the files take more than 'max_bytes', the least recently used
+    ones are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: dict):
+        path = self._path(key)
+        blob = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            try:
+                self._size -= os.path.getsize(path)
+            except OSError:
+                pass
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+            self._size += len(blob)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Called with the lock held
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        self._size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._size -= size
+
+
+class CachingModelClient(ModelClientWrapper):
+    """
+    Answers model calls from a ResponseStore.
+    Responses are keyed by a hash of the full message list plus the model
+    parameters, in one of three modes:
+      - "record": always call the model, store the answer
+      - "replay": answer only from the store, raise CacheMissError otherwise
+      - "read_through": answer from the store, call the model on a miss
+    """
+
+    MODES = ("record", "replay", "read_through")
+
+    def __init__(self, inner: ChatCompletionClient, store: ResponseStore, mode: str, params: dict = None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {self.MODES}")
+        super().__init__(inner)
+        self._store = store
+        self.mode = mode
+        self._params = params or {}
+        self.hits = 0
+        self.misses = 0
+
+    def cache_key(self, messages, tools=[], json_output=None, extra_create_args={}) -> str:
+        # Streamed or not, the answer is the same
+        extra_create_args = {k: v for k, v in extra_create_args.items() if k != "stream_options"}
+        payload = {
+            "messages": [m.model_dump() for m in messages],
+            "tools": [getattr(t, "schema", t) for t in tools],
+            "json_output": json_output,
+            "params": self._params,
+            "extra_create_args": extra_create_args,
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str):
+        if self.mode == "record":
+            return None
+        data = self._store.get(key)
+        if data is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise CacheMissError(f"No recorded model response for key {key}")
+            return None
+        self.hits += 1
+        result = CreateResult.model_validate(data)
+        result.cached = True
+        return result
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        key = self.cache_key(messages, tools, json_output, extra_create_args)
+        result = self._lookup(key)
+        if result is None:
+            result = await self._inner.create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            self._store.put(key, result.model_dump())
+        return result
+
+    async def create_stream(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        key = self.cache_key(messages, tools, json_output, extra_create_args)
+        result = self._lookup(key)
+        if result is not None:
+            if isinstance(result.content, str):
+                yield result.content
+            yield result
+            return
+        async for item in self._inner.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            if isinstance(item, CreateResult):
+                self._store.put(key, item.model_dump())
+            yield item
+
+
+class GovernedModelClient(ModelClientWrapper):
+    """
+    Runs every call of the inner client through a RequestGovernor, under
+    the limits of the model it goes to ('model' unless a profile sets
+    another). A stream is only retried while none of it has been passed on.
+    """
+
+    def __init__(
+        self,
+        inner: ChatCompletionClient,
+        governor: RequestGovernor,
+        completion_estimate: int = 300,
+        model: str = MODEL_NAME,
+    ):
+        super().__init__(inner)
+        self.governor = governor
+        self._completion_estimate = completion_estimate
+        self._model = model
+
+    def _estimate(self, messages, tools, extra_create_args) -> int:
+        """Tokens reserved for a call: the prompt plus the expected reply."""
+        try:
+            prompt = self._inner.count_tokens(messages, tools=tools)
+        except Exception:
+            prompt = sum(len(str(getattr(m, "content", ""))) for m in messages) // 4
+        return prompt + extra_create_args.get("max_tokens", self._completion_estimate)
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        tokens = self._estimate(messages, tools, extra_create_args)
+        model = extra_create_args.get("model", self._model)
+        number = 0
+        while True:
+            try:
+                async with self.governor.attempt(tokens, model):
+                    result = await self._inner.create(
+                        messages,
+                        tools=tools,
+                        json_output=json_output,
+                        extra_create_args=extra_create_args,
+                        cancellation_token=cancellation_token,
+                    )
+                self.governor.settle(tokens, result.usage, model)
+                return result
+            except Exception as e:
+                delay = self.governor.retry_delay(number, e)
+            number += 1
+            await asyncio.sleep(delay)
+
+    async def create_stream(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        tokens = self._estimate(messages, tools, extra_create_args)
+        model = extra_create_args.get("model", self._model)
+        number = 0
+        while True:
+            started = False
+            try:
+                async with self.governor.attempt(tokens, model):
+                    async for item in self._inner.create_stream(
+                        messages,
+                        tools=tools,
+                        json_output=json_output,
+                        extra_create_args=extra_create_args,
+                        cancellation_token=cancellation_token,
+                    ):
+                        if isinstance(item, CreateResult):
+                            self.governor.settle(tokens, item.usage, model)
+                        started = True
+                        yield item
+                return
+            except Exception as e:
+                if started:
+                    raise
+                delay = self.governor.retry_delay(number, e)
+            number += 1
+            await asyncio.sleep(delay)
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    """How one role's completions are generated."""
+    model: str
+    temperature: float = MODEL_TEMPERATURE
+    max_tokens: int = None
+    stop: tuple = None
+
+    def create_args(self) -> dict:
+        args = {"model": self.model, "temperature": self.temperature}
+        if self.max_tokens:
+            args["max_tokens"] = self.max_tokens
+        if self.stop:
+            args["stop"] = list(self.stop)
+        return args
+
+
+# Roles: "selector" (speaker selection), "God", "Host" (the introduction),
+# "host_bookkeeping" (the Host's questions and verdict) and "Arguer".
+# Stop sequences must never cut "Thank you everyone!", which ends the show.
+ROUTED_PROFILES = MappingProxyType({
+    "selector": GenerationProfile(SMALL_MODEL_NAME, temperature=0, max_tokens=8),
+    "God": GenerationProfile(SMALL_MODEL_NAME, temperature=0, max_tokens=60),
+    "Host": GenerationProfile(MODEL_NAME, max_tokens=250),
+    "host_bookkeeping": GenerationProfile(SMALL_MODEL_NAME, temperature=0.7, max_tokens=120),
+    "Arguer": GenerationProfile(MODEL_NAME, max_tokens=90, stop=("\n\n",)),
+})
+
+
+def load_profiles(setting: str):
+    """
+    The generation profiles for a PROFILES setting: None for "off", the
+    routed profiles for "routed", or those updated from a JSON file
+    ({"Arguer": {"model": "...", "max_tokens": 60}, ...}).
+    """
+    if setting == "off":
+        return None
+    if setting == "routed":
+        return ROUTED_PROFILES
+    with open(setting, encoding="utf-8") as f:
+        overrides = json.load(f)
+    profiles = dict(ROUTED_PROFILES)
+    for role, values in overrides.items():
+        if "stop" in values and values["stop"] is not None:
+            values = dict(values, stop=tuple(values["stop"]))
+        base = asdict(profiles[role]) if role in profiles else {"model": MODEL_NAME}
+        profiles[role] = GenerationProfile(**{**base, **values})
+    return MappingProxyType(profiles)
+
+
+GENERATION_PROFILES = load_profiles(PROFILES_SETTING)
+
+
+def profile_role(agent: str, messages) -> str:
+    """The profile role of an agent's call."""
+    if agent in ARGUERS:
+        return "Arguer"
+    if agent == "Host" and any(getattr(m, "source", None) in ARGUERS for m in messages):
+        return "host_bookkeeping"  # the guests have spoken: questions and the verdict
+    return agent
+
+
+class ProfiledModelClient(ModelClientWrapper):
+    """
+    Sends every call of an agent with the model, temperature, max_tokens
+    and stop sequences of its role's GenerationProfile. Roles without a
+    profile keep the client's own settings.
+    """
+
+    def __init__(self, inner: ChatCompletionClient, profiles: dict, agent: str):
+        super().__init__(inner)
+        self._profiles = profiles
+        self._agent = agent
+
+    def _create_args(self, messages, extra_create_args: dict) -> dict:
+        role = profile_role(self._agent, messages)
+        profile = self._profiles.get(role) or self._profiles.get(self._agent)
+        if profile is None:
+            return extra_create_args
+        return {**profile.create_args(), **extra_create_args}
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        return await self._inner.create(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=self._create_args(messages, extra_create_args),
+            cancellation_token=cancellation_token,
+        )
+
+    def create_stream(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        return self._inner.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=self._create_args(messages, extra_create_args),
+            cancellation_token=cancellation_token,
+        )
+
+
+class ContextWindowModelClient(ModelClientWrapper):
+    """
+    Sends an agent a bounded view of the conversation instead of the whole
+    history: its system prompt, the framing (the task, God's line and the
+    Host's introduction), a running summary of the older turns and the
+    last 'keep_last' utterances.
+    The summary is made locally: the first sentence of every folded turn,
+    shortened to 'summary_words' words, newest 'summary_lines' kept.
+    'names' maps agent names to the people they play, for the summary.
+    """
+
+    FRAMING_SOURCES = ("user", "God")
+
+    def __init__(
+        self,
+        inner: ChatCompletionClient,
+        keep_last: int,
+        names: dict = None,
+        summary_words: int = 20,
+        summary_lines: int = 12,
+    ):
+        super().__init__(inner)
+        self.keep_last = keep_last
+        self._names = names or {}
+        self._summary_words = summary_words
+        self._summary_lines = summary_lines
+        self.folded = 0  # turns replaced by a summary line, over all calls
+
+    def _summary_line(self, message) -> str:
+        text = " ".join(str(message.content).split())
+        sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+        words = sentence.split(" ")
+        if len(words) > self._summary_words:
+            sentence = " ".join(words[: self._summary_words]) + "…"
+        source = getattr(message, "source", "")
+        return f"- {self._names.get(source, source)}: {sentence}"
+
+    def window(self, messages: list) -> list:
+        """The messages an agent gets to see."""
+        system, framing, turns = [], [], []
+        host_introduced = False
+        for message in messages:
+            source = getattr(message, "source", None)
+            if isinstance(message, SystemMessage):
+                system.append(message)
+            elif source in self.FRAMING_SOURCES or (source == "Host" and not host_introduced):
+                framing.append(message)
+                host_introduced = host_introduced or source == "Host"
+            else:
+                turns.append(message)
+        if len(turns) <= self.keep_last:
+            return messages
+
+        older, recent = turns[: len(turns) - self.keep_last], turns[len(turns) - self.keep_last:]
+        self.folded += len(older)
+        lines = [self._summary_line(m) for m in older if isinstance(m.content, str)]
+        if len(lines) > self._summary_lines:
+            lines = ["- …"] + lines[-self._summary_lines:]
+        # The guests' turns tell the Host how far the show has come
+        counts = f"{len(older)} turns"
+        if self._names:
+            counts += ": " + ", ".join(
+                f"{sum(getattr(m, 'source', None) == name for m in older)} by {person}"
+                for name, person in self._names.items()
+            )
+        summary = SystemMessage(
+            content=f"Earlier in the conversation ({counts}; summarized):\n" + "\n".join(lines)
+        )
+        return system + framing + [summary] + recent
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        return await self._inner.create(
+            self.window(messages),
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+    def create_stream(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        return self._inner.create_stream(
+            self.window(messages),
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        )
+
+
+def _prompt_key(messages) -> tuple:
+    return tuple((type(m).__name__, getattr(m, "source", None), str(m.content)) for m in messages)
+
+
+class TurnPrefetcher:
+    """
+    Starts agents' model calls before the group chat asks for them.
+    It follows the conversation through observe() and rebuilds, from the
+    agents' system prompts, the prompt an agent will be sent:
+      - after the Host's introduction, Arguer2's opening is started next
+        to Arguer1's (it may ignore Arguer1's opening, which it would
+        otherwise have seen)
+      - with 'speculate', after an arguer speaks the other arguer's reply
+        is started right away; if someone else speaks first (the Host
+        interjects) it is cancelled and thrown away
+    The agent's PrefetchingModelClient takes the result when its turn
+    comes, or calls the model itself when the prompt does not match.
+    """
+
+    def __init__(self, system_messages: dict, speculate: bool):
+        self._system_messages = system_messages
+        self.speculate = speculate
+        self._clients = {}
+        self._history = []
+        self._pending = {}  # agent => (prompt key, allowed extra sources, task)
+        self._host_introduced = False
+        # Metrics
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+
+    def register(self, name: str, client: ChatCompletionClient):
+        """The client that makes 'name''s model calls."""
+        self._clients[name] = client
+
+    def prompt_for(self, name: str) -> list:
+        """The messages the agent 'name' would be sent now."""
+        return [self._system_messages[name]] + [
+            AssistantMessage(content=m.content, source=name) if m.source == name else m
+            for m in self._history
+        ]
+
+    def _start(self, name: str, allowed_extra=()):
+        if name not in self._clients or name not in self._system_messages:
+            return
+        self._cancel(name)
+        prompt = self.prompt_for(name)
+        task = asyncio.ensure_future(self._clients[name].create(prompt))
+        self._pending[name] = (_prompt_key(prompt), frozenset(allowed_extra), task)
+        self.started += 1
+
+    def _cancel(self, name: str):
+        pending = self._pending.pop(name, None)
+        if pending is not None:
+            pending[2].cancel()
+            self.wasted += 1
+
+    def observe(self, message):
+        """Called with every finished message of the conversation."""
+        source = getattr(message, "source", None)
+        if source is None or not isinstance(getattr(message, "content", None), str):
+            return
+        self._history.append(UserMessage(content=message.content, source=source))
+        # Drop the guesses this message made wrong
+        for name, (_, allowed_extra, _) in list(self._pending.items()):
+            if source != name and source not in allowed_extra:
+                self._cancel(name)
+
+        if source == "Host" and not self._host_introduced:
+            self._host_introduced = True
+            self._start("Arguer2", allowed_extra={"Arguer1"})
+        elif self.speculate and source in ARGUERS:
+            other = ARGUERS[1 - ARGUERS.index(source)]
+            if other not in self._pending:
+                self._start(other)
+
+    async def take(self, name: str, messages: list):
+        """A prefetched result for this exact call, or None."""
+        pending = self._pending.pop(name, None)
+        if pending is None:
+            return None
+        key, allowed_extra, task = pending
+        actual = _prompt_key(messages)
+        extra = actual[len(key):]
+        if actual[: len(key)] != key or any(source not in allowed_extra for _, source, _ in extra):
+            task.cancel()
+            self.wasted += 1
+            return None
+        try:
+            result = await task
+        except Exception:
+            return None  # let the agent make the call itself
+        self.hits += 1
+        return result
+
+    def close(self):
+        for name in list(self._pending):
+            self._cancel(name)
+
+
+class PrefetchingModelClient(ModelClientWrapper):
+    """Serves an agent's calls from a TurnPrefetcher when it has them."""
+
+    def __init__(self, inner: ChatCompletionClient, prefetcher: TurnPrefetcher, name: str):
+        super().__init__(inner)
+        self._prefetcher = prefetcher
+        self._name = name
+        prefetcher.register(name, inner)
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        result = await self._prefetcher.take(self._name, messages)
+        if result is None:
+            result = await self._inner.create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+        return result
+
+    async def create_stream(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        result = await self._prefetcher.take(self._name, messages)
+        if result is not None:
+            if isinstance(result.content, str):
+                yield result.content
+            yield result
+            return
+        async for item in self._inner.create_stream(
+            messages,
+            tools=tools,
+            json_output=json_output,
+            extra_create_args=extra_create_args,
+            cancellation_token=cancellation_token,
+        ):
+            yield item
+
+
+async def _pump_stream(stream, step_queue: asyncio.Queue):
+    """Moves every item of 'stream' into 'step_queue', then a done marker."""
+    try:
+        async for item in stream:
+            await step_queue.put(item)
+    except Exception as e:
+        await step_queue.put(e)
+    finally:
+        await step_queue.put(_STREAM_DONE)
+
+
+async def _merge_with_chunks(stream, step_queue: asyncio.Queue, cancellation_token: CancellationToken):
+    """
+    Yields the items of 'stream' together with whatever else (token chunks)
+    is put into 'step_queue' meanwhile, in the order they were produced.
+    'stream' is consumed by a task of its own, so when this generator is
+    left early (closed or cancelled), 'cancellation_token' stops the agents
+    before the stream is wound down; a team's run_stream otherwise waits
+    for the show to play out.
+    """
+    pump = asyncio.ensure_future(_pump_stream(stream, step_queue))
+    try:
+        while True:
+            item = await step_queue.get()
+            if item is _STREAM_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if not pump.done():
+            cancellation_token.cancel()
+        await asyncio.gather(pump, return_exceptions=True)
+
+
+###############################################################################
+# 4a) Tracing of the model calls
+###############################################################################
+class TracingModelClient(ModelClientWrapper):
+    """Records a "model_call" span, with tokens and latency, for every call."""
+
+    def __init__(self, inner: ChatCompletionClient, tracer: Tracer, agent: str):
+        super().__init__(inner)
+        self._tracer = tracer
+        self._agent = agent
+
+    async def create(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        model = extra_create_args.get("model", MODEL_NAME)
+        with self._tracer.span("model_call", self._agent, stream=False, model=model) as span:
+            result = await self._inner.create(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            )
+            span.prompt_tokens, span.completion_tokens = _usage_tokens(result.usage)
+            span.attrs["cached"] = bool(getattr(result, "cached", False))
+        return result
+
+    async def create_stream(self, messages, tools=[], json_output=None, extra_create_args={}, cancellation_token=None):
+        model = extra_create_args.get("model", MODEL_NAME)
+        with self._tracer.span("model_call", self._agent, stream=True, model=model) as span:
+            started = time.perf_counter()
+            async for item in self._inner.create_stream(
+                messages,
+                tools=tools,
+                json_output=json_output,
+                extra_create_args=extra_create_args,
+                cancellation_token=cancellation_token,
+            ):
+                if isinstance(item, CreateResult):
+                    span.prompt_tokens, span.completion_tokens = _usage_tokens(item.usage)
+                    span.attrs["cached"] = bool(getattr(item, "cached", False))
+                elif "first_token_seconds" not in span.attrs:
+                    span.attrs["first_token_seconds"] = time.perf_counter() - started
+                yield item
+
+
+###############################################################################
+# 4b) The model client
+###############################################################################
+def governed_client_args(governor: RequestGovernor) -> dict:
+    """
+    OpenAI client options for a governed client: the governor does the
+    retrying, and sees the rate-limit headers of every response, for the
+    model the request went to.
+    """
+
+    async def on_response(response):
+        try:
+            model = json.loads(response.request.content).get("model", MODEL_NAME)
+        except (ValueError, AttributeError):
+            model = MODEL_NAME
+        governor.observe_headers(response.headers, model)
+
+    return {
+        "max_retries": 0,
+        "http_client": openai.DefaultAsyncHttpxClient(event_hooks={"response": [on_response]}),
+    }
+
+
+class UsageOpenAIChatCompletionClient(OpenAIChatCompletionClient):
+    """
+    OpenAIChatCompletionClient that accepts the usage chunk a stream ends
+    with under stream_options={"include_usage": True}: it has no choices,
+    which the base class takes for an empty chunk and rejects by default.
+    """
+
+    def create_stream(self, messages, *, max_consecutive_empty_chunk_tolerance: int = 2, **kwargs):
+        return super().create_stream(
+            messages, max_consecutive_empty_chunk_tolerance=max_consecutive_empty_chunk_tolerance, **kwargs
+        )
+
+
+def create_model_client(
+    cache_mode: str = MODEL_CACHE_MODE,
+    governor: RequestGovernor = None,
+    api_key: str = None,
+    **client_args,
+) -> ChatCompletionClient:
+    """
+    The OpenAI client, run through the governor if one is given, and
+    wrapped in a CachingModelClient unless cache_mode is "off" (so cache
+    hits cost no rate limit). Replay mode needs no API key; otherwise it
+    comes from 'api_key' or the app's secrets. 'client_args' (e.g.
+    base_url) go to UsageOpenAIChatCompletionClient.
+    """
+    if cache_mode == "replay":
+        api_key = "replay-only"
+    elif api_key is None:
+        api_key = st.secrets["openai"]["OPENAI_API_KEY"]
+    if governor is not None:
+        client_args.update(governed_client_args(governor))
+    client = UsageOpenAIChatCompletionClient(
+        api_key=api_key,
+        model=MODEL_NAME,
+        temperature=MODEL_TEMPERATURE,
+        **client_args,
+    )
+    if governor is not None:
+        client = GovernedModelClient(client, governor)
+    if cache_mode != "off":
+        store = ResponseStore(MODEL_CACHE_DIR, int(MODEL_CACHE_MAX_MB * 1024 * 1024))
+        params = {"model": MODEL_NAME, "temperature": MODEL_TEMPERATURE}
+        client = CachingModelClient(client, store, cache_mode, params)
+    return client
+
+
+###############################################################################
+# 4c) The main multi-agent function
+###############################################################################
+# The agents' system prompts, filled in per conversation with str.format
+GOD_PROMPT = """
+You are God. You will be prompted by the words "Dear God, please speak!" Your reply should be as follows:
+Output exactly one short line, then remain silent:
+
+My children, let {person1} and {person2} converse about '{topic}' with a {style} flavor. Host, your turn!
+
+Remain absolutely silent afterward.
+"""
+
+HOST_PROMPT = """
+You are the conversation Host.
+Your tasks:
+1) Wait for the God to speak. God will introduce guests and the topic, and say "Host, your turn!". It means it's your time to speak.
+2) Choose a subtopic of {topic}. It should be something specific, interesting or controversial. For example, if the topic is "riddles", you must give a riddle. If the topic is "would you rather", you must pose a specific "would you rather" question. But you can also let them converse about the topic in general, for example if the topic is 'debating for a presidential seat', let them pretend they are debating.
+3) Thank God saying "Thanks, God!". Then very briefly introduce {person1} (just this: {facts1}) and {person2} (just this: {facts2}) and mention the topic or subtopic you've invented.
+4) Prompt {person1} and {person2} to speak about the subtopic: ask them to give example. Remind everyone that the conversation should be {style}. Start just with "{person1}, your turn."
+5) You can ask one or two questions per conversation to keep the conversation going.
+6) Allow for a meaningful exchange. At least 5 turns/utterances from each arguer, up to 9, no more.
+7) You must wait until {person1} and {person2} (arguers) exchange At least 5 turns/utterances (from each arguer), up to 9, no more.
+8) Summarize the conversation in one short sentence, then declare a winner in one short sentence.
+7) Say "Thank you everyone!". This will mark the end of the conversation.
+Once you said "Thank you everyone", the conversation is OVER and nobody speaks. Stay silent.
+Stay succinct.
+If one {person1} or {person2} is Donald Trump, remember he is the current US president.
+
+"""
+
+# Added to HOST_PROMPT for tournament matches, whose winner advances
+# (see verdict_winner)
+WINNER_LINE_PROMPT = """
+Right after declaring the winner, write the line "Winner: " followed by the winner's full name.
+"""
+
+ARGUER1_PROMPT = """
+You are {person1}.
+You are conversing with {person2} and the Host. about '{topic}' in a {style} style.
+Stay succinct.
+Start with giving an example that Host asked you about.
+Your speech should be short. 
+Speak in one-liners.
+Most important rule: use speech to mimic the {person1} actual speech.
+Speak totally like {person1} would speak.
+Roast {person2}.
+Don't use too many exclamation marks.
+Mostly give your honest opinion about the topic or raise interesting facts.
+Avoid asking questions.
+The most important rule: use speech to mimic the {person1} actual speech. Speak totally like {person1} would speak.
+Try to outshine {person2} if it seems competitive.
+Stay in character, referencing your historical context.
+If you died before something was known, ask about it.
+Avoid "Ah" in your speech
+If you are Donald Trump, make bold statements appealing to the imagination.
+When the Host gives the verdict stay absolutely silent. The conversation is over.
+"""
+
+ARGUER2_PROMPT = """
+You are {person2}.
+You are conversing with {person1} about '{topic}' in a {style} style.
+Stay succinct.
+Your speech should be short. 
+Speak in one-liners.
+The most important rule: use speech to mimic the {person2} actual speech. Speak totally like {person2} would speak.
+Roast {person1}.
+Be competitive and reasonably disagree with {person1} statements.
+Mostly give your honest opinion about the topic or raise interesting facts.
+Avoid asking questions.
+Don't use too many exclamation marks.
+You can be a bit crazy or make wild statements but still - stay in character, referencing your historical context.
+If you died before something was known, ask about it.
+Avoid "Ah" in your speech
+If you are Donald Trump, make bold statements appealing to the imagination.
+When the Host gives the verdict, stay absolutely silent. The conversation is over.
+"""
+
+
+async def run_famous_people_contest(
+    model_client: ChatCompletionClient = None,
+    setup: ContestSetup = None,
+    stream_tokens: bool = False,
+    scheduler: str = TURN_SCHEDULER,
+    scripted_turns: bool = SCRIPTED_TURNS,
+    tracer: Tracer = None,
+    context_window: int = CONTEXT_WINDOW,
+    pipeline: bool = PIPELINED_TURNS,
+    profiles: dict = GENERATION_PROFILES,
+    max_messages: int = MAX_MESSAGES,
+    max_tokens: int = MAX_CONVERSATION_TOKENS,
+    deadline: float = CONVERSATION_DEADLINE,
+    winner_line: bool = False,
+):
+    """
+    We are going to have a short conversation between:
+      - God (one-line)
+      - Host (introduces two famous people & give a short verdict)
+      - Two arguers
+
+    With 'stream_tokens', the agents' completions are streamed and every
+    text chunk is yielded as a TokenChunk before the agent's final message.
+    With scheduler="local", ShowScheduler picks the speakers instead of the
+    model, which saves one full-history model call per turn.
+    With 'scripted_turns', God's line is said locally and the Host gets the
+    guests' facts from PERSONA_FACTS instead of recalling them.
+    Without a 'model_client', a new one is created for this conversation.
+    Without a 'setup', the people, topic and style are drawn at random.
+    With a 'tracer', every model call and every turn is recorded as a Span.
+    With a 'context_window', the agents only see that many recent
+    utterances (the Host twice as many) plus a summary of the older ones.
+    With 'pipeline', a TurnPrefetcher starts independent model calls early
+    (see PIPELINED_TURNS); messages still arrive in the show's order.
+    With 'profiles', every role (and the speaker selection) gets its own
+    model, temperature, max_tokens and stop sequences.
+    Once 'max_messages', 'max_tokens' or the 'deadline' (seconds) is
+    reached, the chat is stopped and the Host's wrap_up_line is yielded.
+    With 'winner_line' (tournament matches), the Host's verdict ends with
+    a "Winner: <name>" line.
+    Raises ConversationFailedError if the show ends any other way without
+    the Host's closing line (an agent's model call failed).
+    """
+    if model_client is None:
+        model_client = create_model_client()
+
+    if setup is None:
+        setup = draw_contest_setup()
+    person1, person2 = setup.person1, setup.person2
+    topic, style = setup.topic, setup.style
+
+    # Token chunks from all agents and the team's messages share one queue,
+    # so they reach the caller in the order they were produced.
+    step_queue = asyncio.Queue()
+
+    names = {"Arguer1": person1, "Arguer2": person2}
+    # Filled in below, once the system prompts are known
+    system_messages = {}
+    prefetcher = TurnPrefetcher(system_messages, speculate=scheduler != "local") if pipeline else None
+
+    def agent_client(name: str) -> ChatCompletionClient:
+        client = model_client
+        if tracer is not None:
+            client = TracingModelClient(client, tracer, name)
+        if profiles:
+            client = ProfiledModelClient(client, profiles, name)
+        if context_window:
+            keep_last = 2 * context_window if name == "Host" else context_window
+            client = ContextWindowModelClient(client, keep_last, names)
+        if prefetcher is not None:
+            client = PrefetchingModelClient(client, prefetcher, name)
+        if stream_tokens:
+            client = StreamingModelClient(client, name, step_queue.put)
+        return client
+
+    # 1) God
+    god_system_message = GOD_PROMPT.format(person1=person1, person2=person2, topic=topic, style=style)
+    if scripted_turns:
+        god_agent = ScriptedAgent(
+            name="God",
+            description="A deity that briefly introduces the conversation, then is silent.",
+            line=god_line(person1, person2, topic, style),
+        )
+    else:
+        god_agent = AssistantAgent(
+            name="God",
+            description="A deity that briefly introduces the conversation, then is silent.",
+            system_message=god_system_message,
+            model_client=agent_client("God"),
+            tools=[]
+        )
+
+    # 2) Host
+    if scripted_turns:
+        facts1, facts2 = persona_facts(person1), persona_facts(person2)
+    else:
+        facts1 = facts2 = "born-died year, who they are"
+    host_system_message = HOST_PROMPT.format(person1=person1, person2=person2, topic=topic, style=style, facts1=facts1, facts2=facts2)
+    if winner_line:
+        host_system_message += WINNER_LINE_PROMPT
+    host_agent = AssistantAgent(
+        name="Host",
+        description="Introduces conversation, gives a verdict, ends the show with THE_END.",
+        system_message=host_system_message,
+        model_client=agent_client("Host"),
+        tools=[]
+    )
+
+    # 3) Arguer1
+    arguer1_system_message = ARGUER1_PROMPT.format(person1=person1, person2=person2, topic=topic, style=style)
+    arguer1_agent = AssistantAgent(
+        name="Arguer1",
+        description=f"Represents {person1}",
+        system_message=arguer1_system_message,
+        model_client=agent_client("Arguer1"),
+        tools=[]
+    )
+
+    # 4) Arguer2
+    arguer2_system_message = ARGUER2_PROMPT.format(person1=person1, person2=person2, topic=topic, style=style)
+    arguer2_agent = AssistantAgent(
+        name="Arguer2",
+        description=f"Represents {person2}",
+        system_message=arguer2_system_message,
+        model_client=agent_client("Arguer2"),
+        tools=[]
+    )
+
+
+    system_messages.update({
+        "Host": SystemMessage(content=host_system_message),
+        "Arguer1": SystemMessage(content=arguer1_system_message),
+        "Arguer2": SystemMessage(content=arguer2_system_message),
+    })
+
+    # 5) Termination after "Thank you everyone!"
+    # ... or when the conversation's budget runs out
+    budget = BudgetTermination(max_messages, max_tokens, deadline)
+    termination_condition = TextMentionTermination(CLOSING_LINE) | budget
+    participants = [god_agent, host_agent, arguer1_agent, arguer2_agent]
+
+    selector_client = model_client
+    if tracer is not None:
+        selector_client = TracingModelClient(selector_client, tracer, "selector")
+    if profiles:
+        selector_client = ProfiledModelClient(selector_client, profiles, "selector")
+
+    chat = SelectorGroupChat(
+        participants=participants,
+        model_client=selector_client,
+        allow_repeated_speaker=True,
+        termination_condition=termination_condition,
+        selector_func=ShowScheduler.random() if scheduler == "local" else None,
+    )
+
+    cancellation_token = CancellationToken()
+    steps = chat.run_stream(task="Dear God, please speak!", cancellation_token=cancellation_token)
+    # Without stream_tokens, only the team's messages go through the queue
+    steps = _merge_with_chunks(steps, step_queue, cancellation_token)
+    if deadline:
+        steps = _until_deadline(steps, budget, cancellation_token)
+
+    turn_started = time.time()
+    turns = collections.Counter()
+    closed = False
+    finished = False
+    try:
+        async for item in steps:
+            if not isinstance(item, TokenChunk) and isinstance(getattr(item, "content", None), str):
+                turns[item.source] += 1
+                closed = closed or CLOSING_LINE in item.content
+            if prefetcher is not None and not isinstance(item, TokenChunk):
+                prefetcher.observe(item)
+            if tracer is not None and hasattr(item, "source") and not isinstance(item, TokenChunk):
+                # A turn lasts from the previous message to this one
+                now = time.time()
+                prompt_tokens, completion_tokens = _usage_tokens(getattr(item, "models_usage", None))
+                tracer.add(Span(
+                    name="turn",
+                    agent=item.source,
+                    start=turn_started,
+                    duration=now - turn_started,
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                ))
+                turn_started = now
+            yield item  # yield each token chunk and conversation step
+
+        if budget.exceeded is not None and not closed:
+            # Out of budget: the user still gets a verdict, at no model cost
+            if tracer is not None:
+                tracer.add(Span(
+                    name="budget_exceeded",
+                    agent="Host",
+                    start=time.time(),
+                    attrs={"budget": budget.exceeded},
+                ))
+            yield TextMessage(
+                source="Host",
+                content=wrap_up_line(person1, person2, topic, turns["Arguer1"], turns["Arguer2"]),
+            )
+        elif not closed:
+            # An agent's failed model call ends the team's run without an
+            # error; a show without a verdict must not pass for a finished one
+            raise ConversationFailedError()
+        finished = True
+    finally:
+        if not finished:
+            # Abandoned (the session went away or ran again): stop the
+            # agents' model calls instead of letting the show play out
+            cancellation_token.cancel()
+        await steps.aclose()
+        if prefetcher is not None:
+            prefetcher.close()
+            if tracer is not None:
+                tracer.add(Span(
+                    name="prefetch",
+                    agent="",
+                    start=turn_started,
+                    duration=0.0,
+                    attrs={"started": prefetcher.started, "hits": prefetcher.hits, "wasted": prefetcher.wasted},
+                ))
+
+
+async def collect_transcript(setup: ContestSetup = None, model_client: ChatCompletionClient = None) -> Transcript:
+    """Runs a whole conversation and keeps its messages as ChatRecords."""
+    if setup is None:
+        setup = draw_contest_setup()
+    steps = []
+    timings = {}
+    started = time.monotonic()
+    async for msg in run_famous_people_contest(model_client, setup=setup, stream_tokens=False):
+        steps.append(msg)
+        if "first_message_seconds" not in timings and getattr(msg, "source", "user") != "user":
+            timings["first_message_seconds"] = time.monotonic() - started
+    timings["wall_seconds"] = time.monotonic() - started
+    transcript = Transcript(setup=setup, messages=step_records(steps), created_at=time.time(), timings=timings)
+    if not is_complete(transcript):
+        raise ConversationFailedError("The conversation ended before the Host's closing line")
+    return transcript